@@ -0,0 +1,121 @@
+from GameManager import GameManager, agentTime
+from ComputerAI import ComputerAI
+from IntelligentAgent import IntelligentAgent, table_utility, heuristic_table
+from Grid import Grid
+from BitboardGrid import BitboardGrid
+
+import argparse
+import csv
+import json
+import multiprocessing
+import random
+import statistics
+import time
+
+FIELDS = ["game", "seed", "maxTile", "score", "moves", "meanMoveTime", "maxMoveTime", "timedOut", "seconds"]
+
+GRIDS = {"list": Grid, "bitboard": BitboardGrid}
+
+_agent = None
+_gridClass = Grid
+
+def initWorker(agentOptions: dict, grid: str="list") -> None:
+    """ Create the agent reused by every game of a worker process """
+    global _agent, _gridClass
+    options = {"timeLimit": agentTime}
+    options.update(agentOptions)
+    _agent = IntelligentAgent(**options)
+    _gridClass = GRIDS[grid]
+    # load the heuristic table now rather than during the first move
+    if _agent.utility is table_utility:
+        heuristic_table()
+
+def playGame(game: int, seed: int) -> dict:
+    """ Play one seeded game headless and return its result row """
+    random.seed(seed)
+    gameManager = GameManager(4, _agent, ComputerAI(), None, headless=True, gridClass=_gridClass)
+
+    start   = time.perf_counter()
+    maxTile = gameManager.start()
+    times   = gameManager.moveTimes or [0.0]
+
+    return {
+        "game"         : game,
+        "seed"         : seed,
+        "maxTile"      : maxTile,
+        "score"        : gameManager.getScore(),
+        "moves"        : len(gameManager.moveTimes),
+        "meanMoveTime" : round(statistics.mean(times), 6),
+        "maxMoveTime"  : round(max(times), 6),
+        "timedOut"     : gameManager.timedOut,
+        "seconds"      : round(time.perf_counter() - start, 3),
+    }
+
+def playGameArgs(args: tuple) -> dict:
+    return playGame(*args)
+
+def runBatch(games: int, seed: int=0, workers: int=None, output: str="results.jsonl", agentOptions: dict=None, grid: str="list") -> list:
+    """ Play games across a process pool, streaming each result to output
+        (CSV if it ends in .csv, else JSON lines) as soon as it finishes """
+    results = []
+    tasks   = [(i, seed + i) for i in range(games)]
+
+    with open(output, "w", newline="") as f, \
+         multiprocessing.Pool(workers, initWorker, (agentOptions or {}, grid)) as pool:
+        if output.endswith(".csv"):
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            write = lambda row: f.write(json.dumps(row) + "\n")
+
+        for row in pool.imap_unordered(playGameArgs, tasks):
+            write(row)
+            f.flush()
+            results.append(row)
+
+    return results
+
+def printSummary(results: list) -> None:
+    """ Print aggregate statistics of a batch """
+    if not results:
+        print("No games played")
+        return
+
+    scores   = [r["score"] for r in results]
+    tiles    = [r["maxTile"] for r in results]
+    moveTime = [r["meanMoveTime"] for r in results]
+
+    print("games:          %d" % len(results))
+    print("score:          mean %.1f  median %.1f  max %d" % (statistics.mean(scores), statistics.median(scores), max(scores)))
+    print("max tile:       mean %.1f  median %.1f  max %d" % (statistics.mean(tiles), statistics.median(tiles), max(tiles)))
+    print("move time:      mean %.4f  max %.4f" % (statistics.mean(moveTime), max(r["maxMoveTime"] for r in results)))
+    print("timed out:      %d" % sum(r["timedOut"] for r in results))
+
+    for tile in sorted(set(tiles)):
+        reached = sum(t >= tile for t in tiles)
+        print("reached %6d: %5.1f%%" % (tile, 100.0 * reached / len(results)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Play many headless 2048 games in parallel")
+    parser.add_argument("games", type=int, help="number of games")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game, game i uses seed + i")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--output", default="results.jsonl", help="result file, .csv or .jsonl")
+    parser.add_argument("--heuristic", default="default", choices=["default", "table"])
+    parser.add_argument("--grid", default="list", choices=sorted(GRIDS), help="board engine, bitboard = BitboardGrid")
+    parser.add_argument("--time-limit", type=float, default=None, help="seconds per agent move (default: GameManager's maxTime less the agent's margin)")
+    parser.add_argument("--no-batch-leaves", action="store_true", help="score horizon boards one at a time instead of with numpy")
+    args = parser.parse_args()
+
+    agentOptions = {"heuristic": args.heuristic}
+    if args.no_batch_leaves:
+        agentOptions["batchLeaves"] = False
+    if args.time_limit is not None:
+        agentOptions["timeLimit"] = args.time_limit
+
+    results = runBatch(args.games, args.seed, args.workers, args.output, agentOptions, args.grid)
+    printSummary(results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+import os
+from array import array
+
+from Grid import vecIndex, UP, DOWN, LEFT, RIGHT
+
+# The board is packed into a single 64-bit int of 4-bit log2 exponents.
+# Cell (x, y) lives in the nibble at bit 4 * (4 * x + y), so row x is the
+# 16-bit value at bit 16 * x and column y of a row is its y-th nibble.
+# An exponent of 0 is an empty cell, 1 is a 2 tile, ..., 15 is 32768.
+
+ROW_MASK   = 0xFFFF
+CELL_MASK  = 0xF
+MAX_EXP    = 15
+TABLE_SIZE = 1 << 16
+
+TABLE_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bitboard_tables.bin")
+
+def _slideLeft(line: list) -> list:
+    """ Slide and merge a line of exponents towards index 0 """
+    tiles  = [e for e in line if e != 0]
+    result = []
+
+    i = 0
+    while i < len(tiles):
+        if i + 1 < len(tiles) and tiles[i] == tiles[i+1] and tiles[i] != MAX_EXP:
+            result.append(tiles[i] + 1)
+            i += 2
+        else:
+            result.append(tiles[i])
+            i += 1
+
+    return result + [0] * (4 - len(result))
+
+def _pack(line: list) -> int:
+    return line[0] | line[1] << 4 | line[2] << 8 | line[3] << 12
+
+def buildTables():
+    """ Returns the (left, right) row-move tables for all 65536 rows """
+    left  = array("H", bytes(2 * TABLE_SIZE))
+    right = array("H", bytes(2 * TABLE_SIZE))
+
+    for row in range(TABLE_SIZE):
+        line = [(row >> 4 * i) & CELL_MASK for i in range(4)]
+
+        left[row]  = _pack(_slideLeft(line))
+        right[row] = _pack(_slideLeft(line[::-1])[::-1])
+
+    return left, right
+
+def saveTables(tables, path: str=TABLE_CACHE) -> None:
+    """ Write the (left, right) row-move tables to a cache file """
+    with open(path, "wb") as f:
+        for table in tables:
+            table.tofile(f)
+
+def loadTables(path: str=TABLE_CACHE):
+    """ Returns the (left, right) row-move tables read from a cache file """
+    left  = array("H")
+    right = array("H")
+
+    with open(path, "rb") as f:
+        left.fromfile(f, TABLE_SIZE)
+        right.fromfile(f, TABLE_SIZE)
+
+    return left, right
+
+def _initTables():
+    """ Load the tables from the cache, building and caching them if needed """
+    try:
+        return loadTables()
+    except (OSError, EOFError):
+        pass
+
+    tables = buildTables()
+
+    try:
+        saveTables(tables)
+    except OSError:
+        pass
+
+    return tables
+
+ROW_LEFT, ROW_RIGHT = _initTables()
+
+def transpose(board: int) -> int:
+    """ Swap rows and columns of a packed board """
+    a1 = board & 0xF0F00F0FF0F00F0F
+    a2 = board & 0x0000F0F00000F0F0
+    a3 = board & 0x0F0F00000F0F0000
+    a  = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+def _moveRows(board: int, table) -> int:
+    return (table[board & ROW_MASK]
+            | table[(board >> 16) & ROW_MASK] << 16
+            | table[(board >> 32) & ROW_MASK] << 32
+            | table[(board >> 48) & ROW_MASK] << 48)
+
+def moveBoard(board: int, direction: int) -> int:
+    """ Returns the packed board after moving in a direction """
+    if direction == UP:
+        return transpose(_moveRows(transpose(board), ROW_LEFT))
+    if direction == DOWN:
+        return transpose(_moveRows(transpose(board), ROW_RIGHT))
+    if direction == LEFT:
+        return _moveRows(board, ROW_LEFT)
+    if direction == RIGHT:
+        return _moveRows(board, ROW_RIGHT)
+
+    return board
+
+class BitboardGrid:
+    """
+        Drop-in replacement for Grid that stores a 4x4 board as a packed
+        int and moves it with precomputed row tables. Tiles are limited
+        to 32768; two 32768 tiles do not merge.
+    """
+    def __init__(self, size: int=4):
+        if size != 4:
+            raise ValueError("BitboardGrid only supports 4x4 boards")
+
+        self.size  = size
+        self.board = 0
+        self._mapCache = (None, None)
+
+    @property
+    def map(self) -> list:
+        """ Read-only list of lists view of the board, in tile values """
+        board, cached = self._mapCache
+
+        if board != self.board:
+            cached = [[self.getCellValue((x, y)) for y in range(4)] for x in range(4)]
+            self._mapCache = (self.board, cached)
+
+        return cached
+
+    def clone(self):
+        """ Returns a new BitboardGrid with the same board """
+        gridCopy = BitboardGrid(self.size)
+        gridCopy.board = self.board
+
+        return gridCopy
+
+    def saveState(self) -> int:
+        """ Returns a snapshot of the board for restoreState """
+        return self.board
+
+    def restoreState(self, state: int) -> None:
+        """ Undo moves and insertions made since saveState, in place """
+        self.board = state
+
+    def hashKey(self) -> int:
+        """ Returns the packed board, which is already a unique key """
+        return self.board
+
+    def canInsert(self, pos: tuple) -> bool:
+        return self.getCellValue(pos) == 0
+
+    def insertTile(self, pos: tuple, value: int) -> None:
+        if self.canInsert(pos):
+            self.setCellValue(pos, value)
+
+    def crossBound(self, pos: tuple) -> bool:
+        """ Returns True if position is within the board"""
+        return 0 <= pos[0] < self.size and 0 <= pos[1] < self.size
+
+    def setCellValue(self, pos: tuple, value: int) -> None:
+        """ Set the value of cell at position pos to value """
+        if self.crossBound(pos):
+            exp = value.bit_length() - 1 if value else 0
+
+            if exp > MAX_EXP or (value and value != 1 << exp):
+                raise ValueError("Tile value %d cannot be stored in a BitboardGrid" % value)
+
+            shift = 4 * (4 * pos[0] + pos[1])
+            self.board = (self.board & ~(CELL_MASK << shift)) | (exp << shift)
+
+    def getCellValue(self, pos: tuple):
+        """ Return the value at pos if valid """
+        if not self.crossBound(pos):
+            return None
+
+        exp = (self.board >> 4 * (4 * pos[0] + pos[1])) & CELL_MASK
+
+        return 1 << exp if exp else 0
+
+    def getAvailableCells(self) -> list:
+        """ Returns a list of empty cells """
+        board = self.board
+
+        return [(i >> 2, i & 3)
+                for i in range(16)
+                if not (board >> 4 * i) & CELL_MASK]
+
+    def getMaxTile(self) -> int:
+        """ Returns the tile with maximum value """
+        board = self.board
+        exp   = max((board >> 4 * i) & CELL_MASK for i in range(16))
+
+        return 1 << exp if exp else 0
+
+    def move(self, direction: int) -> bool:
+        """ Moves the grid in a specified direction """
+        board = moveBoard(self.board, direction)
+        moved = board != self.board
+        self.board = board
+
+        return moved
+
+    def canMove(self, dirs=vecIndex) -> bool:
+        if self.getAvailableCells():
+            return True
+
+        # A full board can only move by merging
+        return any(moveBoard(self.board, d) != self.board for d in dirs)
+
+    def getAvailableMoves(self, dirs=vecIndex): # -> List[(int, BitboardGrid)]
+        """ Returns a list of available moves, along with moved grids """
+        availableMoves = []
+
+        for x in dirs:
+            board = moveBoard(self.board, x)
+
+            if board != self.board:
+                gridCopy = BitboardGrid(self.size)
+                gridCopy.board = board
+                availableMoves.append((x, gridCopy))
+
+        return availableMoves
@@ -1,6 +1,8 @@
 from BaseDisplayer import BaseDisplayer
 import platform
 import os
+import sys
+import time
 
 colorMap = {
     0     : 97 ,
@@ -25,21 +27,61 @@ colorMap = {
 cTemp = "\x1b[%dm%7s\x1b[0m "
 
 class Displayer(BaseDisplayer):
-    def __init__(self):
+    def __init__(self, every: int=1, maxFps: float=None):
+        """ Redraw every k-th call to display, at most maxFps times a second """
         if "Windows" == platform.system():
-            self.display = self.winDisplay
+            self.frame = self.winFrame
         else:
-            self.display = self.unixDisplay
+            self.frame = self.unixFrame
+
+        self.every       = every
+        self.minInterval = 1.0 / maxFps if maxFps else 0.0
+        self.calls       = 0
+        self.lastDrawn   = None
+
+    def display(self, grid):
+        """ Write the grid as one frame, unless throttled """
+        self.calls += 1
+
+        if (self.calls - 1) % self.every:
+            return
+
+        now = time.perf_counter()
+
+        if self.lastDrawn is not None and now - self.lastDrawn < self.minInterval:
+            return
+
+        self.displayFinal(grid)
+
+    def displayFinal(self, grid):
+        """ Write the grid as one frame, however display is throttled """
+        self.lastDrawn = time.perf_counter()
+        sys.stdout.write(self.frame(grid))
+        sys.stdout.flush()
 
     def winDisplay(self, grid):
-        for i in range(grid.size):
-            for j in range(grid.size):
-                print("%6d  " % grid.map[i][j], end="")
-            print("")
-        print("")
+        sys.stdout.write(self.winFrame(grid))
 
     def unixDisplay(self, grid):
+        sys.stdout.write(self.unixFrame(grid))
+
+    def winFrame(self, grid) -> str:
+        """ Returns the grid as plain text """
+        lines = []
+
+        for i in range(grid.size):
+            lines.append("".join("%6d  " % grid.map[i][j] for j in range(grid.size)))
+        lines.append("")
+
+        return "\n".join(lines) + "\n"
+
+    def unixFrame(self, grid) -> str:
+        """ Returns the grid as coloured text, three lines per row """
+        lines = []
+
         for i in range(3 * grid.size):
+            cells = []
+
             for j in range(grid.size):
                 v = grid.map[int(i / 3)][j]
 
@@ -48,8 +90,15 @@ class Displayer(BaseDisplayer):
                 else:
                     string = " "
 
-                print(cTemp %  (colorMap[v], string), end="")
-            print("")
+                cells.append(cTemp %  (colorMap[v], string))
+            lines.append("".join(cells))
 
             if i % 3 == 2:
-                print("")
+                lines.append("")
+
+        return "\n".join(lines) + "\n"
+
+class NullDisplayer(BaseDisplayer):
+    """ Displayer that draws nothing, for benchmarking """
+    def display(self, grid):
+        pass
@@ -1,6 +1,6 @@
 from Grid       import Grid
 from ComputerAI import ComputerAI
-from IntelligentAgent  import IntelligentAgent
+from IntelligentAgent  import IntelligentAgent, TIME_MARGIN
 from Displayer  import Displayer
 
 import time
@@ -23,30 +23,55 @@ actionDic = {
 timeLimit = 0.2
 allowance = 0.05
 maxTime   = timeLimit + allowance
+agentTime = maxTime - TIME_MARGIN   # search budget given to the agent
 
 class GameManager:
-    def __init__(self, size=4, intelligentAgent=None, computerAI=None, displayer=None):
-        self.grid = Grid(size)
+    def __init__(self, size=4, intelligentAgent=None, computerAI=None, displayer=None, headless=False, gridClass=Grid):
+        self.grid = gridClass(size)   # Grid, or BitboardGrid for 4x4 games
         self.possibleNewTiles = [2, 4]
         self.probability = defaultProbability
         self.initTiles   = defaultInitialTiles
         self.over        = False
+        self.timedOut    = False    # True when the alarm ended the game
+        self.headless    = headless # No printing or displaying when True
+        self.fours       = 0        # Number of 4 tiles spawned, for getScore
+        self.moveTimes   = []       # Time taken by each intelligentAgent move
 
         # Initialize the AI players
         self.computerAI = computerAI or ComputerAI()
-        self.intelligentAgent   = intelligentAgent   or IntelligentAgent()
+        self.intelligentAgent   = intelligentAgent   or IntelligentAgent(timeLimit=agentTime)
         self.displayer  = displayer  or Displayer()
 
+    def log(self, message: str, end: str="\n") -> None:
+        """ Print a message unless running headless """
+        if not self.headless:
+            print(message, end=end)
+
     def updateAlarm(self) -> None:
         """ Checks if move exceeded the time limit and updates the alarm """
         if time.process_time() - self.prevTime > maxTime:
-            self.over = True
+            self.over     = True
+            self.timedOut = True
         
         self.prevTime = time.process_time()
 
     def getNewTileValue(self) -> int:
         """ Returns 2 with probability 0.95 and 4 with 0.05 """
-        return self.possibleNewTiles[random.random() > self.probability]
+        tileValue = self.possibleNewTiles[random.random() > self.probability]
+        if tileValue == 4:
+            self.fours += 1
+        return tileValue
+
+    def getScore(self) -> int:
+        """ Returns the game score, the sum of all merged tile values """
+        # A tile 2^k built from 2s scored (k-1) * 2^k points in merges,
+        # except spawned 4s which were never merged from two 2s
+        score = 0
+        for row in self.grid.map:
+            for value in row:
+                if value > 2:
+                    score += value * (value.bit_length() - 2)
+        return score - 4 * self.fours
 
     def insertRandomTiles(self, numTiles:int):
         """ Insert numTiles number of random tiles. For initialization """
@@ -60,8 +85,12 @@ class GameManager:
         """ Main method that handles running the game of 2048 """
 
         # Initialize the game
+        if hasattr(self.intelligentAgent, "newGame"):
+            self.intelligentAgent.newGame()
+
         self.insertRandomTiles(self.initTiles)
-        self.displayer.display(self.grid)
+        if not self.headless:
+            self.displayer.display(self.grid)
         turn          = PLAYER_TURN # Player AI Goes First
         self.prevTime = time.process_time()
 
@@ -72,10 +101,12 @@ class GameManager:
             move = None
 
             if turn == PLAYER_TURN:
-                print("Player's Turn: ", end="")
+                self.log("Player's Turn: ", end="")
+                moveStart = time.perf_counter()
                 move = self.intelligentAgent.getMove(gridCopy)
-                
-                print(actionDic[move])
+                self.moveTimes.append(time.perf_counter() - moveStart)
+
+                self.log(actionDic[move])
 
                 # If move is valid, attempt to move the grid
                 if move != None and 0 <= move < 4:
@@ -83,34 +114,41 @@ class GameManager:
                         self.grid.move(move)
 
                     else:
-                        print("Invalid intelligentAgent Move - Cannot move")
+                        self.log("Invalid intelligentAgent Move - Cannot move")
                         self.over = True
                 else:
-                    print("Invalid intelligentAgent Move - Invalid input")
+                    self.log("Invalid intelligentAgent Move - Invalid input")
                     self.over = True
             else:
-                print("Computer's turn: ")
+                self.log("Computer's turn: ")
                 move = self.computerAI.getMove(gridCopy)
 
                 # Validate Move
                 if move and self.grid.canInsert(move):
                     self.grid.setCellValue(move, self.getNewTileValue())
                 else:
-                    print("Invalid Computer AI Move")
+                    self.log("Invalid Computer AI Move")
                     self.over = True
 
-            # Comment out during heuristing optimizations to increase runtimes.
-            # Printing slows down computation time.
-            self.displayer.display(self.grid)
-
             # Exceeding the Time Allotted for Any Turn Terminates the Game
             self.updateAlarm()
+
+            # Rendering happens after the alarm and restarts the clock, so
+            # it is not charged to either player's time. The final board is
+            # always drawn, by displayFinal when the displayer throttles
+            if not self.headless:
+                if self.over or not self.grid.canMove():
+                    getattr(self.displayer, "displayFinal", self.displayer.display)(self.grid)
+                else:
+                    self.displayer.display(self.grid)
+                self.prevTime = time.process_time()
+
             turn = 1 - turn
 
         return self.grid.getMaxTile()
 
 def main():
-    intelligentAgent = IntelligentAgent()
+    intelligentAgent = IntelligentAgent(timeLimit=agentTime)
     computerAI  = ComputerAI()
     displayer   = Displayer()
     gameManager = GameManager(4, intelligentAgent, computerAI, displayer)
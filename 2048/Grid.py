@@ -1,5 +1,3 @@
-from copy import deepcopy
-
 directionVectors = (UP_VEC, DOWN_VEC, LEFT_VEC, RIGHT_VEC) = ((-1, 0), (1, 0), (0, -1), (0, 1))
 vecIndex = [UP, DOWN, LEFT, RIGHT] = range(4)
 
@@ -11,10 +9,34 @@ class Grid:
     def clone(self):
         """ Returns a new Grid with a cloned map """
         gridCopy = Grid(self.size)
-        gridCopy.map = deepcopy(self.map)
+        gridCopy.map = [row[:] for row in self.map]
 
         return gridCopy
 
+    def saveState(self) -> list:
+        """ Returns a snapshot of the board for restoreState """
+        # Copying and restoring the rows take about a third of the time
+        # of packing them into an int as hashKey does and unpacking it
+        return [row[:] for row in self.map]
+
+    def restoreState(self, state: list) -> None:
+        """ Undo moves and insertions made since saveState, in place """
+        for row, saved in zip(self.map, state):
+            row[:] = saved
+
+    def hashKey(self) -> int:
+        """ Returns the board packed into an int of 5-bit log2 exponents """
+        key   = 0
+        shift = 0
+
+        for row in self.map:
+            for value in row:
+                if value:
+                    key |= (value.bit_length() - 1) << shift
+                shift += 5
+
+        return key
+
     def canInsert(self, pos: tuple) -> bool:
         return self.getCellValue(pos) == 0
 
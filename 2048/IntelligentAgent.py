@@ -1,17 +1,54 @@
+import os
 import time
+import mmap
+import multiprocessing
+import threading
 #import math
+from array import array
 from BaseAI import BaseAI
+from Grid import vecIndex
+from BitboardGrid import transpose, moveBoard, ROW_MASK, CELL_MASK, MAX_EXP, TABLE_SIZE
+from TranspositionTable import TranspositionTable, EXACT, LOWER, UPPER
+
+try:
+    import numpy as np
+except ImportError:             # leaves are scored one at a time without numpy
+    np = None
 
 # DONE: use clock to time each move
 # DONE: implement expectiminimax
 # DONE: alpha-beta pruning
 # DONE: use # of free tiles, then move on to more complex
+# DONE: iterative deepening on a monotonic clock
 
-MAX_DEPTH = 5
+MAX_DEPTH = 15                  # deepest iteration of iterative deepening
 POS_INF = float('Inf')
 NEG_INF = float('-Inf')
-TIME_LIMIT = 0.15
+# The budget is timed with perf_counter, while GameManager's alarm uses
+# process_time, which never runs ahead of it in a single process. Work
+# after the deadline measured at most 0.0001 s over 2400 turns, and a
+# full gc collection with the table allocated takes up to 0.019 s.
+# GameManager and BatchRunner pass timeLimit=maxTime - TIME_MARGIN; an
+# agent built without one stays inside the 0.2 s turn limit
+TIME_MARGIN = 0.02              # measured overrun plus one full collection
+TIME_LIMIT = 0.2 - TIME_MARGIN
 CHANCE = {"two":0.9, "four":0.1}
+TT_MEGABYTES = 64               # memory cap of the transposition table
+BATCH_LEAVES = np is not None   # score horizon boards with batch_utility
+PROB_THRESHOLD = 0.01           # chance branches below this are scored statically
+MAX_CELLS = 6                   # empty cells searched per chance node
+HEURISTIC = "default"           # "default" or "table" (see table_utility)
+WORKERS = 0                     # processes searching root moves, 0 = none, else 4 or more
+RESULT_MARGIN = 0.01            # time left for collecting worker results
+WORKER_START_TIMEOUT = 60       # seconds a pool worker waits for the others
+MONO_WEIGHT = 5                 # weight of monotonicity in every heuristic
+SMOOTH_WEIGHT = 2               # weight of smoothness in every heuristic
+LINE_SCORE_VERSION = 1          # bump when the terms of line_score change
+# the cache is named by everything line_score depends on, so a table
+# saved for other weights or terms is never mapped; it is rebuilt instead
+HEURISTIC_KEY = "v%d_m%d_s%d" % (LINE_SCORE_VERSION, MONO_WEIGHT, SMOOTH_WEIGHT)
+HEURISTIC_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "heuristic_table_%s.bin" % HEURISTIC_KEY)
 
 def compare(x, y):
     if x > y:
@@ -74,91 +111,431 @@ def smoothness(state):
  
 def utility(state):
     #print(free_tiles(state), monotonicity(state), smoothness(state))
-    return (free_tiles(state) + 5*monotonicity(state) + 2*smoothness(state))
+    return (free_tiles(state) + MONO_WEIGHT*monotonicity(state) + SMOOTH_WEIGHT*smoothness(state))
     #return (1/100*free_tiles(state) + monotonicity(state) + smoothness(state))
 
-def decision(state, time_limit, depth):
-    """ return optimal move """
-    ((move, __), __) = maximize(state, NEG_INF, POS_INF, time_limit, depth+1)
-    #print(f"time used: {end_time - start_time}")
-    return move
 
+def line_score(line):
+    """ heuristic score of one row or column of tile values """
+    # monotonicity as above, plus the free tiles of the line weighted by
+    # its largest tile. Smoothness compares neighbours along the line, so
+    # over 4 rows and 4 columns it is the usual smoothness; smoothness()
+    # above compares rows twice (the second time wrapping column -1 to
+    # column 3) and never compares columns. The table heuristic is
+    # therefore a different evaluation from utility(), not a faster one
+    score = line.count(0) * max(line)
+    for j in [1, 2, 3]:
+        if line[j-1] < line[j]:
+            score -= MONO_WEIGHT * (line[j] - line[j-1])
+        score -= SMOOTH_WEIGHT * abs(line[j-1] - line[j])
+    return score
 
-def chance(state, alpha, beta, time_limit, depth):
-    """ get average all chance event: value = {2, 4} """
-    (__, two_utility) = minimize(state, 2, alpha, beta, time_limit, depth)
-    (__, four_utility) = minimize(state, 4, alpha, beta, time_limit, depth)
-    return (CHANCE["two"] * two_utility + CHANCE["four"] * four_utility)
-    
 
-def minimize(state, value, alpha, beta, time_limit, depth):
-    """ find child state with the lowest utility value """
-    # for minimize (Computer AI)
-    # move = (cell, value)
-    (move, grid) = state
-    
-    cells = grid.getAvailableCells()
-    
-    if (len(cells) == 0):
-        return (state, utility(state))
-    
-    if time.clock() > time_limit or depth > MAX_DEPTH:
-        return (state, utility(state))
-    
-    (min_child, min_utility) = ((None, None), POS_INF)
+def build_heuristic_table():
+    """ line_score of all 65536 exponent-encoded rows """
+    table = array("i", bytes(4 * TABLE_SIZE))
+    for row in range(TABLE_SIZE):
+        exps = [(row >> 4 * i) & CELL_MASK for i in range(4)]
+        table[row] = line_score([1 << e if e else 0 for e in exps])
+    return table
+
+
+def save_heuristic_table(table, path=HEURISTIC_CACHE):
+    """ write the heuristic table to disk for load_heuristic_table """
+    # other workers may have the file mapped, so it is replaced, never
+    # truncated, and never seen half written
+    temp = "%s.%d.tmp" % (path, os.getpid())
+    with open(temp, "wb") as f:
+        table.tofile(f)
+    os.replace(temp, path)
+
+
+def load_heuristic_table(path=HEURISTIC_CACHE):
+    """ memory-map a saved heuristic table """
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mapped) != 4 * TABLE_SIZE:
+        mapped.close()
+        raise ValueError("%s is not a heuristic table" % path)
+    return memoryview(mapped).cast("i")
+
+
+_heuristic_table = None
+
+def heuristic_table():
+    """ the heuristic table, mapped from the cache or built on first use """
+    global _heuristic_table
+    if _heuristic_table is None:
+        try:
+            _heuristic_table = load_heuristic_table()
+        except (OSError, ValueError):
+            _heuristic_table = build_heuristic_table()
+            try:
+                save_heuristic_table(_heuristic_table)
+            except OSError:
+                pass
+    return _heuristic_table
+
+
+def pack_board(grid):
+    """ grid as a BitboardGrid packed int, tiles above 32768 capped """
+    if hasattr(grid, "board"):
+        return grid.board
+    board = 0
+    for x in range(4):
+        for y in range(4):
+            value = grid.map[x][y]
+            if value:
+                board |= min(value.bit_length() - 1, MAX_EXP) << 4 * (4 * x + y)
+    return board
+
+
+def table_utility(state):
+    """ sum of line_score over the 4 rows and 4 columns, by table lookup;
+        differs from utility() in its free tiles and smoothness terms """
+    (__, grid) = state
+    table = heuristic_table()
+    board = pack_board(grid)
+    cols = transpose(board)
+    return (table[board & ROW_MASK] + table[(board >> 16) & ROW_MASK]
+            + table[(board >> 32) & ROW_MASK] + table[(board >> 48) & ROW_MASK]
+            + table[cols & ROW_MASK] + table[(cols >> 16) & ROW_MASK]
+            + table[(cols >> 32) & ROW_MASK] + table[(cols >> 48) & ROW_MASK])
+
+
+def unpack_boards(packed):
+    """ (N, 4, 4) array of tile values from N BitboardGrid packed ints """
+    shifts = np.arange(0, 64, 4, dtype=np.uint64)
+    exps = ((np.array(packed, dtype=np.uint64)[:, np.newaxis] >> shifts) & CELL_MASK).astype(np.int64)
+    return np.where(exps > 0, np.left_shift(1, exps), 0).reshape(-1, 4, 4)
+
+
+def batch_utility(boards):
+    """ utility of N boards given as an (N, 4, 4) array of tile values """
+    # same terms as free_tiles, monotonicity and smoothness, computed for
+    # the whole batch at once
+    free = (boards == 0).sum(axis=(1, 2)) * boards.max(axis=(1, 2))
+    mono = -(np.maximum(boards[:, :, 1:] - boards[:, :, :-1], 0).sum(axis=(1, 2))
+             + np.maximum(boards[:, 1:, :] - boards[:, :-1, :], 0).sum(axis=(1, 2)))
+    # smoothness() compares rows twice, the second time for rows 1-3 with
+    # column -1 wrapping around to column 3
+    lower = boards[:, 1:, :]
+    smooth = -(np.abs(boards[:, :, 1:] - boards[:, :, :-1]).sum(axis=(1, 2))
+               + np.abs(np.roll(lower, 1, axis=2) - lower).sum(axis=(1, 2)))
+    return free + MONO_WEIGHT*mono + SMOOTH_WEIGHT*smooth
+
+
+class SearchTimeout(Exception):
+    """ raised inside the search once the deadline has passed """
+
+
+_worker_agent = None
+
+def _init_worker(options, ready):
+    """ create the agent a pool worker searches with, then wait at the
+        ready barrier until every worker has done the same """
+    global _worker_agent
+    _worker_agent = IntelligentAgent(**options)
+    if _worker_agent.utility is table_utility:
+        heuristic_table()
+    # a worker the pool restarts later finds the barrier aborted
+    try:
+        ready.wait(WORKER_START_TIMEOUT)
+    except threading.BrokenBarrierError:
+        pass
+
+
+def _ping(__):
+    return os.getpid()
+
+
+def _search_root_child(direction, grid, time_limit, game):
+    """ iteratively deepen below one root move in a worker process, returns
+        the value of the chance node for every completed depth """
+    agent = _worker_agent
+    # positions cached by the worker during an earlier game are dropped
+    if agent.game != game:
+        agent.newGame()
+        agent.game = game
+    agent.table.newSearch()
+    values = []
+    for max_depth in range(1, MAX_DEPTH + 1, 2):
+        agent.maxDepth = max_depth
+        try:
+            values.append(agent.chance((direction, grid), NEG_INF, POS_INF, time_limit, 2))
+        except SearchTimeout:
+            break
+    return (direction, values)
+
+
+class IntelligentAgent(BaseAI):
+    def __init__(self, timeLimit=TIME_LIMIT, tableMegabytes=TT_MEGABYTES,
+                 batchLeaves=BATCH_LEAVES, heuristic=HEURISTIC,
+                 probThreshold=PROB_THRESHOLD, maxCells=MAX_CELLS,
+                 workers=WORKERS):
+        # with fewer workers than root moves, a move would wait for a free
+        # worker and only start at the deadline
+        if 0 < workers < len(vecIndex):
+            raise ValueError("workers must be 0 or at least %d, one per root move" % len(vecIndex))
+        self.timeLimit = timeLimit
+        self.probThreshold = probThreshold
+        self.maxCells = maxCells
+        if heuristic == "table":
+            # table lookups are cheaper than a numpy batch
+            self.utility = table_utility
+            self.batchLeaves = False
+        else:
+            self.utility = utility
+            self.batchLeaves = batchLeaves and np is not None
+        # transposition table of maximize nodes, kept for a whole game
+        self.table = TranspositionTable(tableMegabytes)
+        self.maxDepth = 1
+        self.rootScores = {}
+        self.game = 0           # games started, tells workers to clear their tables
+        self.workers = workers
+        self.pool = None
+        if workers > 0:
+            # build or map the heuristic table once here, so the workers
+            # inherit it or map the saved file instead of each building it
+            if heuristic == "table":
+                heuristic_table()
+            # start the workers now and wait until all of them are up, so
+            # the first move does not pay for process startup. No worker
+            # takes a task before all of them pass the ready barrier, so
+            # the ping returns only once every worker is initialized
+            options = dict(tableMegabytes=tableMegabytes, batchLeaves=batchLeaves,
+                           heuristic=heuristic, probThreshold=probThreshold,
+                           maxCells=maxCells)
+            ready = multiprocessing.Barrier(workers)
+            self.pool = multiprocessing.Pool(workers, _init_worker, (options, ready))
+            self.pool.map(_ping, range(workers))
+            ready.abort()
+
+    def close(self):
+        """ shut down the worker pool """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def newGame(self):
+        """ forget positions cached during a previous game """
+        self.table.clear()
+        self.game += 1
+
+    def getMove(self, grid): 
+        """ iterative deepening: search depth 1, 3, 5, ... until the time
+            limit and return the best move of the last completed depth """
+        time_limit = time.perf_counter() + self.timeLimit
+        self.table.newSearch()
+        if self.pool is not None:
+            return self.parallel_decision(grid, time_limit)
+        return self.serial_decision(grid, time_limit)
+
+    def serial_decision(self, grid, time_limit):
+        """ iterative deepening of the whole tree in this process """
+        state = (None, grid)
+        best = None
+        self.rootScores = {}
+        
+        for max_depth in range(1, MAX_DEPTH + 1, 2):
+            self.maxDepth = max_depth
+            try:
+                best = self.decision(state, time_limit, 0)
+            except SearchTimeout:
+                break
+            
+        if best is None:
+            moves = grid.getAvailableMoves()
+            best = moves[0][0] if moves else None
+        return best
+
+    def parallel_decision(self, grid, time_limit):
+        """ search every root move in its own worker until the deadline and
+            compare the moves at the deepest depth all of them completed """
+        # perf_counter is system-wide on Linux, so workers share the deadline
+        tasks = []
+        for direction in vecIndex:
+            child = grid.clone()
+            if child.move(direction):
+                tasks.append((direction, child, time_limit - RESULT_MARGIN, self.game))
+        if not tasks:
+            return None
+
+        results = self.pool.starmap(_search_root_child, tasks)
+        completed = min(len(values) for (__, values) in results)
+        if completed == 0:
+            return tasks[0][0]
+        (best, __) = max(results, key=lambda result: result[1][completed-1])
+        return best
+
+    def decision(self, state, time_limit, depth):
+        """ return optimal move """
+        (__, grid) = state
+        saved = grid.saveState()
+        try:
+            (move, __) = self.maximize(state, NEG_INF, POS_INF, time_limit, depth+1)
+        finally:
+            grid.restoreState(saved)
+        return move
+
+    def sample_cells(self, cells):
+        """ at most maxCells empty cells, spread evenly over the board """
+        n = len(cells)
+        if n <= self.maxCells:
+            return cells
+        return [cells[i * n // self.maxCells] for i in range(self.maxCells)]
+
+    def chance(self, state, alpha, beta, time_limit, depth, prob=1.0):
+        """ get average all chance event: value = {2, 4} """
+        # prob is the probability of the tiles inserted on the way here;
+        # branches less likely than probThreshold get the static score
+        if prob * CHANCE["two"] < self.probThreshold:
+            two_utility = self.utility(state)
+        else:
+            (__, two_utility) = self.minimize(state, 2, alpha, beta, time_limit, depth, prob * CHANCE["two"])
+        if prob * CHANCE["four"] < self.probThreshold:
+            four_utility = self.utility(state)
+        else:
+            (__, four_utility) = self.minimize(state, 4, alpha, beta, time_limit, depth, prob * CHANCE["four"])
+        return (CHANCE["two"] * two_utility + CHANCE["four"] * four_utility)
+
+    def leaf_scores(self, grid, cells, value):
+        """ for each cell, the utility of the board after each legal move
+            with value inserted there, all scored with one batch_utility
+            call; used one ply above the horizon, where the maximize
+            children would only return the utility of those boards """
+        # the moves are made on packed boards with the row tables, so the
+        # grid itself is never moved or copied; like pack_board, tiles
+        # above 32768 are scored as 32768
+        board = pack_board(grid)
+        exp = value.bit_length() - 1
+        packed = []
+        indexes = []
+        for (x, y) in cells:
+            inserted = board | exp << 4 * (4 * x + y)
+            moves = {}
+            for direction in vecIndex:
+                moved = moveBoard(inserted, direction)
+                if moved != inserted:
+                    moves[direction] = len(packed)
+                    packed.append(moved)
+            indexes.append(moves)
+        if not packed:
+            return indexes
+        scores = batch_utility(unpack_boards(packed)).tolist()
+        return [{d: scores[k] for (d, k) in moves.items()} for moves in indexes]
+
+    def minimize(self, state, value, alpha, beta, time_limit, depth, prob=1.0):
+        """ find child state with the lowest utility value """
+        # for minimize (Computer AI)
+        # move = (cell, value)
+        # children are searched by inserting into the grid and clearing the
+        # cell again, so no board is copied
+        (move, grid) = state
+        
+        cells = grid.getAvailableCells()
         
-    for cell in cells:
-        child_grid = grid.clone()
-        child_grid.insertTile(cell, value)
-        child = ((cell, value), child_grid)
+        if (len(cells) == 0) or depth > self.maxDepth:
+            return (move, self.utility(state))
         
-        (__, child_utility) = maximize(child, alpha, beta, time_limit, depth+1)
+        if time.perf_counter() > time_limit:
+            raise SearchTimeout()
         
-        if child_utility < min_utility:
-            (min_child, min_utility) = (child, child_utility)
+        (min_move, min_utility) = (None, POS_INF)
+        cells = self.sample_cells(cells)
+        # the maximize children are at the horizon, so the boards after
+        # every move below every cell are scored at once
+        if self.batchLeaves and depth + 1 == self.maxDepth:
+            leaves = self.leaf_scores(grid, cells, value)
+        else:
+            leaves = [None] * len(cells)
             
-        if min_utility <= alpha:
-            break
+        for (cell, cell_leaves) in zip(cells, leaves):
+            grid.setCellValue(cell, value)
+            (__, child_utility) = self.maximize(((cell, value), grid), alpha, beta, time_limit, depth+1, prob, cell_leaves)
+            grid.setCellValue(cell, 0)
+            
+            if child_utility < min_utility:
+                (min_move, min_utility) = ((cell, value), child_utility)
+                
+            if min_utility <= alpha:
+                break
+            
+            if min_utility < beta:
+                beta = min_utility
         
-        if min_utility < beta:
-            beta = min_utility
-    
-    return (min_child, min_utility)
+        return (min_move, min_utility)
 
+    def order_moves(self, key, depth):
+        """ root moves by the previous iteration's scores, elsewhere the
+            cached best move first """
+        if depth == 1 and self.rootScores:
+            return sorted(vecIndex, key=lambda d: -self.rootScores.get(d, NEG_INF))
+        entry = self.table.get(key)
+        if entry is None or entry[3] is None:
+            return vecIndex
+        return [entry[3]] + [d for d in vecIndex if d != entry[3]]
 
-def maximize(state, alpha, beta, time_limit, depth):
-    """ find child state with highest utility value """
-    (move, grid) = state
-    
-    moveset = grid.getAvailableMoves()
-    
-    if (len(moveset) == 0):
-        return (state, utility(state))
-    
-    if time.clock() > time_limit or depth > MAX_DEPTH:
-        return (state, utility(state))
-    
-    (max_child, max_utility) = ((None, None), NEG_INF)
-    
-    for child in moveset:
-        child_utility = chance(child, alpha, beta, time_limit, depth+1)
+    def maximize(self, state, alpha, beta, time_limit, depth, prob=1.0, leaves=None):
+        """ find child state with highest utility value """
+        # children are searched by moving the grid and restoring the saved
+        # board afterwards: one snapshot per node, none per child (a copy
+        # of the rows on Grid, an int on BitboardGrid); leaves holds
+        # the scores of the moves when minimize has already batched them
+        (move, grid) = state
         
-        if child_utility > max_utility:
-            (max_child, max_utility) = (child, child_utility)
-            
-        if max_utility >= beta:
-            break
+        if depth > self.maxDepth:
+            return (move, self.utility(state))
+        
+        if time.perf_counter() > time_limit:
+            raise SearchTimeout()
+        
+        # look up the position, searched to at least the remaining depth
+        key = grid.hashKey()
+        remaining = self.maxDepth - depth
+        cached = self.table.probe(key, remaining, alpha, beta, prob)
+        if cached is not None and depth > 1:
+            return (self.table.get(key)[3], cached)
         
-        if max_utility > alpha:
-            alpha = max_utility
+        saved = grid.saveState()
+        alpha_orig = alpha
+        (max_move, max_utility) = (None, NEG_INF)
+        scores = {}
+        
+        for direction in self.order_moves(key, depth):
+            if leaves is not None:
+                if direction not in leaves:
+                    continue
+                child_utility = leaves[direction]
+            else:
+                if not grid.move(direction):
+                    continue
+                child_utility = self.chance((direction, grid), alpha, beta, time_limit, depth+1, prob)
+                grid.restoreState(saved)
+            scores[direction] = child_utility
+            
+            if child_utility > max_utility:
+                (max_move, max_utility) = (direction, child_utility)
+                
+            if max_utility >= beta:
+                break
+            
+            if max_utility > alpha:
+                alpha = max_utility
 
-    return (max_child, max_utility)    
-    
+        if max_move is None:
+            return (move, self.utility(state))
 
-class IntelligentAgent(BaseAI):
-    def getMove(self, grid): 
-        time_limit = time.clock() + TIME_LIMIT
-        move = None
-        depth = 0
-        state = (move, grid)            # state: tuple(grid, move, depth)
-        return decision(state, time_limit, depth)
\ No newline at end of file
+        if depth == 1:
+            self.rootScores = scores
+
+        if max_utility <= alpha_orig:
+            bound = UPPER
+        elif max_utility >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.table.store(key, max_utility, remaining, bound, max_move, prob)
+
+        return (max_move, max_utility)
@@ -0,0 +1,109 @@
+from array import array
+
+# Bound types of a stored search value
+(EXACT, LOWER, UPPER) = (0, 1, 2)
+
+# Rough size of one entry (key int and reference, array fields) in bytes
+ENTRY_SIZE = 80
+
+NO_MOVE = -1                    # stored move of an entry without one
+
+class TranspositionTable:
+    """
+        Bounded cache of searched positions keyed by Grid.hashKey().
+        Each entry holds (value, depth, bound, move, prob), where depth is
+        the number of plies searched below the position and prob the
+        probability of reaching it that the search pruned chance branches
+        by. A lower prob prunes more, so an entry only answers searches of
+        at most its depth and prob.
+
+        Entries live in preallocated slots indexed by key % size, one
+        array per field, so the table never grows. A key colliding with
+        another position replaces it when that entry was stored before
+        the last newSearch() or searched no deeper. ages[i] is the search
+        a slot was stored in; clear() only starts a new epoch.
+    """
+    def __init__(self, maxMegabytes: float=64):
+        # an odd size, so key % size mixes every cell of the packed key
+        self.size  = max(1, int(maxMegabytes * 1024 * 1024 / ENTRY_SIZE)) | 1
+        self.count = 0
+        self.age   = 1
+        self.epoch = 1
+        self.hits  = 0
+        self.keys   = [None] * self.size
+        self.values = array("d", bytes(8 * self.size))
+        self.depths = array("b", bytes(self.size))
+        self.bounds = array("b", bytes(self.size))
+        self.moves  = array("b", [NO_MOVE]) * self.size
+        self.probs  = array("d", bytes(8 * self.size))
+        self.ages   = array("q", bytes(8 * self.size))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def clear(self) -> None:
+        """ Drop every entry, e.g. at the start of a new game """
+        # freeing a full table takes ~80 ms, too long inside a move
+        self.age  += 1
+        self.epoch = self.age
+        self.count = 0
+        self.hits  = 0
+
+    def newSearch(self) -> None:
+        """ Let the entries stored so far be replaced by any later store """
+        self.age += 1
+
+    def get(self, key):
+        """ Returns the (value, depth, bound, move, prob) entry for key or None """
+        i = key % self.size
+
+        if self.keys[i] == key and self.ages[i] >= self.epoch:
+            move = self.moves[i]
+            return (self.values[i], self.depths[i], self.bounds[i],
+                    None if move == NO_MOVE else move, self.probs[i])
+
+        return None
+
+    def probe(self, key, depth: int, alpha: float, beta: float, prob: float=1.0):
+        """ Returns a stored value usable for a search of depth plies at
+            probability prob within (alpha, beta), or None """
+        i = key % self.size
+
+        if (self.keys[i] != key or self.ages[i] < self.epoch
+                or self.depths[i] < depth or self.probs[i] < prob):
+            return None
+
+        value = self.values[i]
+        bound = self.bounds[i]
+
+        if (bound == EXACT
+                or (bound == LOWER and value >= beta)
+                or (bound == UPPER and value <= alpha)):
+            self.hits += 1
+            return value
+
+        return None
+
+    def store(self, key, value: float, depth: int, bound: int, move=None, prob: float=1.0) -> None:
+        """ Store a search result, keeping a result for the same key that
+            was searched deeper or less pruned, and no worse in the other,
+            and a deeper result of this search for another key """
+        i = key % self.size
+
+        if self.ages[i] < self.epoch:
+            self.count += 1
+        elif self.keys[i] == key:
+            (old_depth, old_prob) = (self.depths[i], self.probs[i])
+            if (old_depth >= depth and old_prob >= prob
+                    and (old_depth != depth or old_prob != prob)):
+                return
+        elif self.ages[i] == self.age and self.depths[i] > depth:
+            return
+
+        self.keys[i]   = key
+        self.values[i] = value
+        self.depths[i] = depth
+        self.bounds[i] = bound
+        self.moves[i]  = NO_MOVE if move is None else move
+        self.probs[i]  = prob
+        self.ages[i]   = self.age
@@ -5,16 +5,49 @@ from collections import deque
 import sys
 import math
 import time
-import queue as Q
 import heapq
+import itertools
 import resource
+import os
+import mmap
+import json
+import csv
+import argparse
+import multiprocessing
+import tracemalloc
+from array import array
+
+def tile_bits(n):
+    """ number of bits per tile in a packed board, 4 up to the 15-puzzle """
+    return max(4, (n*n - 1).bit_length())
+
+def pack_config(config, n):
+    """ pack a config list into an int, tile at index i in bits [b*i, b*(i+1)) """
+    bits = tile_bits(n)
+    board = 0
+    for idx, value in enumerate(config):
+        board |= value << (bits * idx)
+    return board
+
+def unpack_board(board, n):
+    """ inverse of pack_config """
+    bits = tile_bits(n)
+    mask = (1 << bits) - 1
+    return [(board >> (bits * idx)) & mask for idx in range(n*n)]
 
 ## The Class that Represents the Puzzle
 class PuzzleState(object):
     """
         The PuzzleState stores a board configuration and implements
         movement instructions to generate valid children.
+        The board is packed into a single int (see pack_config), so states
+        are small and can be hashed and compared by their board. With a
+        PatternDatabase heuristic, indices holds the state's packed pattern
+        indices so a child's h is updated from them.
     """
+    __slots__ = ("n", "board", "cost", "parent", "action", "g", "h", "depth", "blank_index",
+                 "indices")
+
     def __init__(self, config, n, parent=None, action="Initial", cost=0):
         """
         :param config->List : Represents the n*n board, for e.g. [0,1,2,3,4,5,6,7,8] represents the goal state.
@@ -32,19 +65,47 @@ class PuzzleState(object):
         self.cost     = cost
         self.parent   = parent
         self.action   = action
-        self.config   = config
-        self.children = []
+        self.board    = pack_config(config, n)
         self.g        = cost
         self.h        = cost
         self.depth    = 0
+        self.indices  = None
 
         # Get the index and (row, col) of empty block
-        self.blank_index = self.config.index(0)
+        self.blank_index = config.index(0)
+
+    @property
+    def config(self):
+        """ The board as a list, e.g. [0,1,2,3,4,5,6,7,8] """
+        return unpack_board(self.board, self.n)
 
     def display(self):
         """ Display this Puzzle state as a n*n board """
+        config = self.config
         for i in range(self.n):
-            print(self.config[3*i : 3*(i+1)])       # shoudn't 3 be replaced by self.n
+            print(config[3*i : 3*(i+1)])       # shoudn't 3 be replaced by self.n
+
+    def slide(self, blank, action):
+        """
+        Swaps the blank tile with the tile at index blank.
+        :return a PuzzleState with the new configuration
+        """
+        bits = tile_bits(self.n)
+        tile = (self.board >> (bits * blank)) & ((1 << bits) - 1)
+
+        # skip __init__, the board is already known to be valid
+        state = PuzzleState.__new__(PuzzleState)
+        state.n      = self.n
+        state.cost   = 0
+        state.parent = self
+        state.action = action
+        state.board  = self.board + (tile << (bits * self.blank_index)) - (tile << (bits * blank))
+        state.g      = 0
+        state.h      = 0
+        state.depth  = 0
+        state.indices = None
+        state.blank_index = blank
+        return state
 
     def move_up(self):
         """ 
@@ -53,17 +114,7 @@ class PuzzleState(object):
         """
         if self.blank_index < self.n:
             return None
-        else:
-            state = PuzzleState(list(self.config), self.n)
-            blank = state.blank_index - self.n
-            temp = state.config[state.blank_index]
-            state.config[state.blank_index] = state.config[blank]
-            state.config[blank] = temp
-            state.blank_index = blank
-            state.action = 'Up'
-            state.parent = self
-        return state
-        
+        return self.slide(self.blank_index - self.n, 'Up')
       
     def move_down(self):
         """
@@ -72,16 +123,7 @@ class PuzzleState(object):
         """
         if self.blank_index >= self.n * (self.n - 1):
             return None
-        else:
-            state = PuzzleState(list(self.config), self.n)
-            blank = state.blank_index + self.n
-            temp = state.config[state.blank_index]
-            state.config[state.blank_index] = state.config[blank]
-            state.config[blank] = temp
-            state.blank_index = blank
-            state.action = 'Down'
-            state.parent = self
-        return state
+        return self.slide(self.blank_index + self.n, 'Down')
     
     def move_left(self):
         """
@@ -90,16 +132,7 @@ class PuzzleState(object):
         """
         if self.blank_index % self.n == 0:
             return None
-        else:
-            state = PuzzleState(list(self.config), self.n)
-            blank = state.blank_index - 1
-            temp = state.config[state.blank_index]
-            state.config[state.blank_index] = state.config[blank]
-            state.config[blank] = temp
-            state.blank_index = blank
-            state.action = 'Left'
-            state.parent = self
-        return state
+        return self.slide(self.blank_index - 1, 'Left')
 
     def move_right(self):
         """
@@ -108,23 +141,11 @@ class PuzzleState(object):
         """
         if (self.blank_index + 1) % self.n == 0:
             return None
-        else:
-            state = PuzzleState(list(self.config), self.n)
-            blank = state.blank_index + 1
-            temp = state.config[state.blank_index]
-            state.config[state.blank_index] = state.config[blank]
-            state.config[blank] = temp
-            state.blank_index = blank
-            state.action = 'Right'
-            state.parent = self
-        return state
+        return self.slide(self.blank_index + 1, 'Right')
       
     def expand(self):
         """ Generate the child nodes of this node """
-        
-        # Node has already been expanded
-        if len(self.children) != 0:
-            return self.children
+        # Children are not cached on the node, they are rebuilt when needed
         
         # Add child nodes in order of UDLR
         children = [
@@ -133,9 +154,8 @@ class PuzzleState(object):
             self.move_left(),
             self.move_right()]
 
-        # Compose self.children of all non-None children states
-        self.children = [state for state in children if state is not None]
-        return self.children
+        # Return all non-None children states
+        return [state for state in children if state is not None]
 
 # Function that Writes to output.txt
             
@@ -149,163 +169,916 @@ def writeOutput(string, file="output.txt"):
 
 def backtracking(state, max_dep, expanded):
     path = deque()
-    path_cost = 0
     while state.parent != None:
-        path_cost += 1
         path.appendleft(	state.action)
         state = state.parent
-    writeOutput("path_to_goal: " + str(list(path)) + "\n" +
+    write_solution(list(path), max_dep, expanded)
+    return
+
+
+OUTPUT_FILE = "output.txt"       # None keeps solutions in last_solution only
+last_solution = {}
+
+def write_solution(path, max_dep, expanded):
+    """write the path to goal and search statistics to output.txt"""
+    path_cost = len(path)
+    last_solution.clear()
+    last_solution.update(path_to_goal=path, cost_of_path=path_cost,
+                         nodes_expanded=expanded, max_search_depth=max_dep)
+    if OUTPUT_FILE is None:
+        return
+    writeOutput("path_to_goal: " + str(path) + "\n" +
                 "cost_of_path: " + str(path_cost) + "\n" +
                 "nodes_expanded: " + str(expanded) + "\n" +
                 "search_depth: " + str(path_cost) + "\n" +
-                "max_search_depth: " + str(max_dep) + "\n")
+                "max_search_depth: " + str(max_dep) + "\n", OUTPUT_FILE)
     return
     
 
-def bfs_search(initial_state):
+class SearchStats(object):
+    """
+        Observer of bfs_search, dfs_search and A_star_search.
+        The search calls start() once, sample() every `every` expansions
+        and finish() when it returns. Each sample records the elapsed
+        time, nodes expanded and generated, frontier and visited sizes,
+        and duplicate children (generated but not pushed). Searches only
+        test `stats is not None` when no observer is given. Subclasses
+        can override the three calls to watch a search live.
+    """
+    def __init__(self, every=1000):
+        self.every = every
+        self.search = None
+        self.samples = []
+        self.summary = {}
+        self.heuristic_time = 0.0
+        self.start_time = 0.0
+
+    def start(self, search):
+        self.search = search
+        self.samples = []
+        self.summary = {}
+        self.heuristic_time = 0.0
+        self.start_time = time.perf_counter()
+
+    def timed(self, cost_function):
+        """wrap calculate_total_cost to add its time to heuristic_time"""
+        def timed_cost(state, heuristic=None):
+            start = time.perf_counter()
+            cost_function(state, heuristic)
+            self.heuristic_time += time.perf_counter() - start
+        return timed_cost
+
+    def sample(self, expanded, generated, frontier, visited, duplicates):
+        self.samples.append({"seconds": round(time.perf_counter() - self.start_time, 6),
+                             "expanded": expanded, "generated": generated,
+                             "frontier": frontier, "visited": visited,
+                             "duplicates": duplicates})
+
+    def finish(self, result, expanded, generated, frontier, visited, duplicates):
+        self.sample(expanded, generated, frontier, visited, duplicates)
+        seconds = self.samples[-1]["seconds"] or 1e-9
+        self.summary = {"result": result, "seconds": seconds,
+                        "expanded_per_second": round(expanded / seconds, 1),
+                        "generated_per_second": round(generated / seconds, 1),
+                        "duplicate_rate": round(duplicates / generated, 4) if generated else 0.0,
+                        "heuristic_share": round(self.heuristic_time / seconds, 4)}
+
+    def to_json(self, path):
+        """write the trace as JSON, for comparing runs"""
+        with open(path, "w") as f:
+            json.dump({"search": self.search, "every": self.every,
+                       "summary": self.summary, "samples": self.samples}, f, indent=1)
+
+def bfs_search(initial_state, stats=None):
     """BFS search"""
     # initial_state -> PuzzleState
-    frontier = Q.Queue()
-    explored = set()
+    frontier = deque()
     visited = set()
     expanded = 0
+    generated = 0
     max_dep = 0
     
-    frontier.put(initial_state)
-    visited.add(str(initial_state.config))
-    while not frontier.empty():
-        state = frontier.get()
-        explored.add(state)
+    if stats is not None:
+        stats.start("bfs")
+    frontier.append(initial_state)
+    visited.add(initial_state.board)
+    while len(frontier):
+        state = frontier.popleft()
         
         if test_goal(state):
+            if stats is not None:
+                stats.finish("Success", expanded, generated, len(frontier), len(visited),
+                             generated - len(visited) + 1)
             backtracking(state, max_dep, expanded)
             return "Success"
         
-        state.expand()
         expanded += 1
-        for child in state.children:
-            if str(child.config) not in visited:
+        children = state.expand()
+        generated += len(children)
+        for child in children:
+            if child.board not in visited:
                 child.depth = state.depth + 1
                 if child.depth > max_dep:
                     max_dep = child.depth
-                frontier.put(child)
-                visited.add(str(child.config))
+                frontier.append(child)
+                visited.add(child.board)
+        if stats is not None and expanded % stats.every == 0:
+            stats.sample(expanded, generated, len(frontier), len(visited),
+                         generated - len(visited) + 1)
+    if stats is not None:
+        stats.finish("Failure", expanded, generated, 0, len(visited), generated - len(visited) + 1)
     return "Failure"
+
+REVERSE = {'Up': 'Down', 'Down': 'Up', 'Left': 'Right', 'Right': 'Left'}
+
+def bidirectional_search(initial_state):
+    """Bidirectional BFS search"""
+    # Grows one full BFS layer at a time from the start or the goal,
+    # whichever frontier is smaller. Boards are packed ints and frontiers
+    # hold (board, blank index). forward[b] = (previous board, action from
+    # it) and backward[b] = (next board towards the goal, action to it).
+    n = initial_state.n
+    bits = tile_bits(n)
+    mask = (1 << bits) - 1
+    moves = ((-n, 'Up'), (n, 'Down'), (-1, 'Left'), (1, 'Right'))
+    goal = goal_board(n)
+    start = initial_state.board
+    forward = {start: None}
+    backward = {goal: None}
+    frontiers = {True: deque([(start, initial_state.blank_index)]),
+                 False: deque([(goal, 0)])}
+    depths = {True: 0, False: 0}
+    expanded = 0
+    meet = start if start == goal else None
+
+    while meet is None and len(frontiers[True]) and len(frontiers[False]):
+        is_forward = len(frontiers[True]) <= len(frontiers[False])
+        (seen, other) = (forward, backward) if is_forward else (backward, forward)
+        layer = frontiers[is_forward]
+        next_layer = deque()
+        depths[is_forward] += 1
+        for (board, blank) in layer:
+            expanded += 1
+            for (offset, action) in moves:
+                target = blank + offset
+                if target < 0 or target >= n*n:
+                    continue
+                if offset == -1 and blank % n == 0:
+                    continue
+                if offset == 1 and target % n == 0:
+                    continue
+                tile = (board >> (bits * target)) & mask
+                child = board + (tile << (bits * blank)) - (tile << (bits * target))
+                if child in seen:
+                    continue
+                seen[child] = (board, action if is_forward else REVERSE[action])
+                if child in other:
+                    meet = child
+                    break
+                next_layer.append((child, target))
+            if meet is not None:
+                break
+        frontiers[is_forward] = next_layer
+
+    if meet is None:
+        return "Failure"
+
+    path = deque()
+    board = meet
+    while forward[board] is not None:
+        (board, action) = forward[board]
+        path.appendleft(action)
+    board = meet
+    while backward[board] is not None:
+        (board, action) = backward[board]
+        path.append(action)
+    write_solution(list(path), max(depths.values()), expanded)
+    return "Success"
    
-def dfs_search(initial_state):
+def dfs_search(initial_state, stats=None):
     """DFS search"""
     ### STUDENT CODE GOES HERE ###
     frontier = deque()
     visited = set()
     expanded = 0
+    generated = 0
     max_dep = 0
     
+    if stats is not None:
+        stats.start("dfs")
     frontier.append(initial_state)
-    visited.add(str(initial_state.config))
+    visited.add(initial_state.board)
     while len(frontier):
         state = frontier.pop()
         
         if test_goal(state):
+            if stats is not None:
+                stats.finish("Success", expanded, generated, len(frontier), len(visited),
+                             generated - len(visited) + 1)
             backtracking(state, max_dep, expanded)
             return "Success"
         
-        state.expand()
         expanded += 1
-        for child in reversed(state.children):
-            if str(child.config) not in visited:
+        children = state.expand()
+        generated += len(children)
+        for child in reversed(children):
+            if child.board not in visited:
                 child.depth = state.depth + 1
                 if child.depth > max_dep:
                     max_dep = child.depth
                 frontier.append(child)
-                visited.add(str(child.config))
+                visited.add(child.board)
+        if stats is not None and expanded % stats.every == 0:
+            stats.sample(expanded, generated, len(frontier), len(visited),
+                         generated - len(visited) + 1)
 
+    if stats is not None:
+        stats.finish("Failure", expanded, generated, 0, len(visited), generated - len(visited) + 1)
     return "Failure"
 
-def A_star_search(initial_state):
+def depth_limited(initial_state, limit, counters, cache_size=0):
+    """depth-first search of the states at most limit moves away,
+    returns the goal state or None"""
+    # Only the boards on the current path are remembered, in on_path, so
+    # memory is linear in limit. With cache_size the shallowest depth of
+    # up to cache_size boards is also kept, and a board reached again no
+    # shallower is skipped since its subtree was already searched with at
+    # least as many moves left. counters["cutoff"] is set when a state
+    # was not expanded because of the limit.
+    if test_goal(initial_state):
+        return initial_state
+    if limit == 0:
+        counters["cutoff"] = True
+        return None
+    cache = {}
+    on_path = {initial_state.board}
+    stack = [(initial_state, iter(initial_state.expand()))]
+    counters["expanded"] += 1
+
+    while stack:
+        (state, children) = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            on_path.discard(state.board)
+            continue
+        if child.board in on_path:
+            continue
+        child.depth = state.depth + 1
+        if cache_size:
+            seen = cache.get(child.board)
+            if seen is not None and seen <= child.depth:
+                continue
+            if seen is not None or len(cache) < cache_size:
+                cache[child.board] = child.depth
+        if child.depth > counters["max_dep"]:
+            counters["max_dep"] = child.depth
+
+        if test_goal(child):
+            return child
+        if child.depth == limit:
+            counters["cutoff"] = True
+            continue
+        counters["expanded"] += 1
+        on_path.add(child.board)
+        stack.append((child, iter(child.expand())))
+    return None
+
+def dls_search(initial_state, limit, cache_size=0):
+    """Depth-limited DFS search"""
+    counters = {"expanded": 0, "max_dep": 0, "cutoff": False}
+    goal = depth_limited(initial_state, limit, counters, cache_size)
+    if goal is not None:
+        backtracking(goal, counters["max_dep"], counters["expanded"])
+        return "Success"
+    return "Cutoff" if counters["cutoff"] else "Failure"
+
+def iddfs_search(initial_state, cache_size=0):
+    """Iterative deepening DFS search"""
+    # Depth-limited searches with limits 0, 1, 2, ... so the first goal
+    # found is at the optimal depth. Nodes are counted over all iterations.
+    counters = {"expanded": 0, "max_dep": 0, "cutoff": True}
+    limit = 0
+    while counters["cutoff"]:
+        counters["cutoff"] = False
+        goal = depth_limited(initial_state, limit, counters, cache_size)
+        if goal is not None:
+            backtracking(goal, counters["max_dep"], counters["expanded"])
+            return "Success"
+        limit += 1
+    return "Failure"
+
+def A_star_search(initial_state, heuristic=None, stats=None):
     """A * search"""
     ### STUDENT CODE GOES HERE ###
-    config_to_p = {}
+    # Heap entries are (cost, tie, state), tie counting up so equal costs
+    # pop in insertion order. A cheaper path to a board pushes a new entry
+    # instead of updating the old one, which is skipped when popped since
+    # its board is already closed.
     frontier = []
+    best_g = {}
+    closed = set()
+    tie = itertools.count()
     expanded = 0
+    generated = 0
+    pushed = 0
     max_dep = 0
     
-    heapq.heapify(frontier)
-    calculate_total_cost(initial_state)
-    heapq.heappush(frontier, (initial_state.cost, initial_state))
-    
-    config_to_p[tuple(initial_state.config)] = initial_state
+    total_cost = calculate_total_cost
+    if stats is not None:
+        stats.start("ast")
+        total_cost = stats.timed(calculate_total_cost)
+    total_cost(initial_state, heuristic)
+    heapq.heappush(frontier, (initial_state.cost, next(tie), initial_state))
+    best_g[initial_state.board] = initial_state.g
 
     while len(frontier):
-        state = heapq.heappop(frontier)[1]
+        state = heapq.heappop(frontier)[2]
+        if state.board in closed:
+            continue
+        closed.add(state.board)
         
         if test_goal(state):
+            if stats is not None:
+                stats.finish("Success", expanded, generated, len(frontier), len(closed),
+                             generated - pushed)
             backtracking(state, max_dep, expanded)
             return "Success"
         
-        state.expand()
         expanded += 1
-        for child in state.children:
-            if tuple(child.config) in config_to_p:
-                child = config_to_p[tuple(child.config)]
-                if (child.cost, child) in frontier and state.g < child.parent.g:
-                    idx = frontier.index((child.cost, child))
-                    calculate_total_cost(child)
-                    child.depth = state.depth + 1
-                    if child.depth > max_dep:
-                        max_dep = child.depth
-                    frontier[idx] = (child.cost, child)
-                    heapq.heapify(frontier)
-            else:
-                child.depth = state.depth + 1
-                if child.depth > max_dep:
-                    max_dep = child.depth
-                calculate_total_cost(child)
-                heapq.heappush(frontier, (child.cost, child))
-                config_to_p[tuple(child.config)] = child
+        children = state.expand()
+        generated += len(children)
+        for child in children:
+            if child.board in closed:
+                continue
+            total_cost(child, heuristic)
+            if child.board in best_g and child.g >= best_g[child.board]:
+                continue
+            child.depth = state.depth + 1
+            if child.depth > max_dep:
+                max_dep = child.depth
+            best_g[child.board] = child.g
+            heapq.heappush(frontier, (child.cost, next(tie), child))
+            pushed += 1
+        if stats is not None and expanded % stats.every == 0:
+            stats.sample(expanded, generated, len(frontier), len(closed), generated - pushed)
 
+    if stats is not None:
+        stats.finish("Failure", expanded, generated, 0, len(closed), generated - pushed)
     return "Failure"
 
-def calculate_total_cost(state):
+PDB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pdb")
+
+def default_patterns(n):
+    """disjoint tile groups, 4-4 for the 8-puzzle and 5-5-5 for the 15-puzzle"""
+    size = 5 if n == 4 else 4
+    tiles = list(range(1, n*n))
+    return [tuple(tiles[i : i+size]) for i in range(0, len(tiles), size)]
+
+class PatternDatabase(object):
+    """
+        Additive disjoint pattern databases for the n*n puzzle.
+        Each pattern is a group of tiles. Its table holds, for every
+        placement of those tiles, the number of moves of pattern tiles
+        needed to bring them home, found by a backward BFS from the goal
+        in which the other tiles cannot be told apart. Since every move
+        moves a tile of exactly one pattern, the sum over patterns is
+        admissible.
+
+        A placement (p_0, ..., p_k-1) of a pattern is stored at index
+        sum(p_i * (n*n)**i) of a byte array, so moving one tile changes
+        the index by a constant. Tables are saved under directory and
+        memory-mapped on later runs. For A* the indices of all patterns
+        are also packed into one int, index_bits bits per pattern.
+    """
+    def __init__(self, n, patterns=None, directory=PDB_DIR):
+        self.n = n
+        self.patterns = patterns or default_patterns(n)
+        self.directory = directory
+        self.tables = [self.load_or_build(pattern) for pattern in self.patterns]
+        # group[tile] and weight[tile] move the index when tile moves,
+        # packed_weight[tile] moves the packed indices
+        self.group = [None] * (n*n)
+        self.weight = [0] * (n*n)
+        self.packed_weight = [0] * (n*n)
+        self.index_bits = max(len(table) - 1 for table in self.tables).bit_length()
+        for (g, pattern) in enumerate(self.patterns):
+            for (i, tile) in enumerate(pattern):
+                self.group[tile] = g
+                self.weight[tile] = (n*n) ** i
+                self.packed_weight[tile] = self.weight[tile] << (self.index_bits * g)
+
+    def path(self, pattern):
+        return os.path.join(self.directory, "pdb%d_%s.bin" % (self.n, "-".join(map(str, pattern))))
+
+    def load_or_build(self, pattern):
+        """memory-map the table of a pattern, building it first if needed"""
+        path = self.path(pattern)
+        if not os.path.exists(path):
+            table = build_pattern_table(self.n, pattern)
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            # batch workers may build the same table at once
+            temp = "%s.%d.tmp" % (path, os.getpid())
+            with open(temp, "wb") as f:
+                f.write(table)
+            os.replace(temp, path)
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def indices(self, config):
+        """table index of every pattern for a config"""
+        indices = [0] * len(self.patterns)
+        for (idx, tile) in enumerate(config):
+            if tile:
+                indices[self.group[tile]] += idx * self.weight[tile]
+        return indices
+
+    def packed_indices(self, config):
+        """indices of a config packed into one int"""
+        packed = 0
+        for (g, i) in enumerate(self.indices(config)):
+            packed |= i << (self.index_bits * g)
+        return packed
+
+    def __call__(self, config):
+        """heuristic value of a config"""
+        return sum(table[i] for (table, i) in zip(self.tables, self.indices(config)))
+
+def build_pattern_table(n, pattern):
+    """backward BFS over placements of the pattern tiles, see PatternDatabase"""
+    # A search state is a placement plus the region of free cells the
+    # blank can reach without moving a pattern tile, named by its lowest
+    # cell. Moving the blank inside its region is free, moving a pattern
+    # tile into the region costs one move. Regions are bitmasks.
+    cells = n*n
+    k = len(pattern)
+    weights = [cells ** i for i in range(k)]
+    neighbours = [[q for q in (p - n, p + n, p - 1 if p % n else -1, p + 1 if (p + 1) % n else -1)
+                   if 0 <= q < cells] for p in range(cells)]
+    full = (1 << cells) - 1
+    not_first = sum(1 << p for p in range(cells) if p % n)
+    not_last = sum(1 << p for p in range(cells) if (p + 1) % n)
+
+    def region(bit, free):
+        while True:
+            grown = bit | (((bit << 1) & not_first | (bit >> 1) & not_last
+                            | (bit << n) | (bit >> n)) & free)
+            if grown == bit:
+                return bit
+            bit = grown
+
+    table = bytearray(b"\xff") * (cells ** k)
+    seen = bytearray(cells ** (k + 1))
+    start = sum(tile * w for (tile, w) in zip(pattern, weights))
+    table[start] = 0
+    seen[start * cells] = 1
+    frontier = array("L", [start * cells])
+    depth = 0
+    while len(frontier):
+        depth += 1
+        next_frontier = array("L")
+        for key in frontier:
+            (index, low) = divmod(key, cells)
+            positions = [(index // w) % cells for w in weights]
+            free = full
+            for p in positions:
+                free &= ~(1 << p)
+            reach = region(1 << low, free)
+            for (i, p) in enumerate(positions):
+                for q in neighbours[p]:
+                    if not (reach >> q) & 1:
+                        continue
+                    child = index + (q - p) * weights[i]
+                    child_reach = region(1 << p, (free | (1 << p)) & ~(1 << q))
+                    child_key = child * cells + (child_reach & -child_reach).bit_length() - 1
+                    if not seen[child_key]:
+                        seen[child_key] = 1
+                        next_frontier.append(child_key)
+                        if table[child] == 255:
+                            table[child] = depth
+        frontier = next_frontier
+    return table
+
+def ida_search(initial_state, pdb=None):
+    """IDA* search"""
+    # Depth-first searches bounded by f = g + h, raising the bound to the
+    # smallest f that exceeded it. Tiles are moved in place in a single
+    # board list and moved back on return, so memory stays linear in the
+    # solution depth. With a PatternDatabase the pattern indices are
+    # updated the same way, one table lookup per move.
+    n = initial_state.n
+    board = initial_state.config
+    goal = list(range(n*n))
+    dist = manhattan_table(n)
+    path = []
+    stats = {"expanded": 0, "max_dep": 0}
+    # (offset of the tile swapped with the blank, action, reverse action)
+    moves = ((-n, 'Up', 'Down'), (n, 'Down', 'Up'),
+             (-1, 'Left', 'Right'), (1, 'Right', 'Left'))
+
+    def search(blank, g, h, bound, prev):
+        f = g + h
+        if f > bound:
+            return f
+        if h == 0 and board == goal:
+            return True
+        stats["expanded"] += 1
+        if g + 1 > stats["max_dep"]:
+            stats["max_dep"] = g + 1
+        minimum = float('inf')
+        for (offset, action, reverse) in moves:
+            if reverse == prev:
+                continue
+            target = blank + offset
+            if target < 0 or target >= n*n:
+                continue
+            if offset == -1 and blank % n == 0:
+                continue
+            if offset == 1 and target % n == 0:
+                continue
+            tile = board[target]
+            if pdb is None:
+                child_h = h - dist[tile][target] + dist[tile][blank]
+            else:
+                group = pdb.group[tile]
+                old = indices[group]
+                indices[group] = old + (blank - target) * pdb.weight[tile]
+                child_h = h - tables[group][old] + tables[group][indices[group]]
+            board[blank], board[target] = tile, 0
+            path.append(action)
+            t = search(target, g + 1, child_h, bound, action)
+            if t is True:
+                return True
+            path.pop()
+            board[target], board[blank] = tile, 0
+            if pdb is not None:
+                indices[group] = old
+            if t < minimum:
+                minimum = t
+        return minimum
+
+    if pdb is None:
+        h = sum(dist[value][idx] for idx, value in enumerate(board))
+    else:
+        indices = pdb.indices(board)
+        tables = pdb.tables
+        h = pdb(board)
+    bound = h
+    while True:
+        t = search(board.index(0), 0, h, bound, None)
+        if t is True:
+            write_solution(path, stats["max_dep"], stats["expanded"])
+            return "Success"
+        if t == float('inf'):
+            return "Failure"
+        bound = t
+
+def manhattan_table(n):
+    """dist[value][idx]: manhattan distance of tile value at index idx"""
+    return [[0 if value == 0 else
+             abs(value % n - idx % n) + abs(value // n - idx // n)
+             for idx in range(n*n)]
+            for value in range(n*n)]
+
+CHECK_INCREMENTAL = False       # compare every incremental h with a full recomputation
+
+def calculate_total_cost(state, heuristic=None):
     """calculate the total estimated cost of a state"""
     ### STUDENT CODE GOES HERE ###
-    if state.parent is None:
+    # heuristic(config) replaces the manhattan distance when given; a
+    # PatternDatabase updates the parent's pattern indices and h for the
+    # one tile that moved, as ida_search does. Otherwise h is manhattan
+    # distance plus linear conflicts, updated from the parent's h the
+    # same way.
+    parent = state.parent
+    if parent is None:
         state.g = 0
     else:
-        state.g = state.parent.g + 1
-    state.h = 0
-    for idx, value in enumerate(state.config):
-        state.h += calculate_manhattan_dist(idx, value, state.n)
+        state.g = parent.g + 1
+    if isinstance(heuristic, PatternDatabase):
+        if parent is None or parent.indices is None:
+            state.indices = heuristic.packed_indices(state.config)
+            state.h = heuristic(state.config)
+        else:
+            bits = tile_bits(state.n)
+            (src, dst) = (state.blank_index, parent.blank_index)
+            tile = (state.board >> (bits * dst)) & ((1 << bits) - 1)
+            state.indices = parent.indices + (dst - src) * heuristic.packed_weight[tile]
+            group = heuristic.group[tile]
+            shift = heuristic.index_bits * group
+            mask = (1 << heuristic.index_bits) - 1
+            table = heuristic.tables[group]
+            state.h = (parent.h - table[(parent.indices >> shift) & mask]
+                       + table[(state.indices >> shift) & mask])
+            if CHECK_INCREMENTAL:
+                full = heuristic(state.config)
+                if state.h != full:
+                    raise RuntimeError("incremental h %d != %d for %s" % (state.h, full, state.config))
+    elif heuristic is not None:
+        state.h = heuristic(state.config)
+    elif parent is not None:
+        state.h = parent.h + heuristic_delta(state)
+        if CHECK_INCREMENTAL:
+            full = manhattan_conflict(state.config, state.n)
+            if state.h != full:
+                raise RuntimeError("incremental h %d != %d for %s" % (state.h, full, state.config))
+    else:
+        state.h = manhattan_conflict(state.config, state.n)
     state.cost = state.g + state.h
     return
 
+def manhattan_conflict(config, n):
+    """manhattan distance plus linear conflicts of every row and column"""
+    h = 0
+    for idx, value in enumerate(config):
+        h += calculate_manhattan_dist(idx, value, n)
+    for line in range(n):
+        h += line_conflict(config[line*n : (line+1)*n], n, line, True)
+        h += line_conflict(config[line::n], n, line, False)
+    return h
+
+def line_conflict(tiles, n, line, is_row):
+    """
+    Linear conflict of one row or column, given its tiles in order.
+    Tiles whose goal is in this line must end up in goal order, so all but
+    a longest increasing run of their goal positions have to step out of
+    the line and back, two extra moves each.
+    """
+    goals = []
+    for value in tiles:
+        if value == 0:
+            continue
+        if is_row and value // n == line:
+            goals.append(value % n)
+        elif not is_row and value % n == line:
+            goals.append(value // n)
+    if len(goals) < 2:
+        return 0
+    longest = [1] * len(goals)
+    for i in range(len(goals)):
+        for j in range(i):
+            if goals[j] < goals[i] and longest[j] + 1 > longest[i]:
+                longest[i] = longest[j] + 1
+    return 2 * (len(goals) - max(longest))
+
+def board_line(board, n, line, is_row):
+    """tiles of one row or column of a packed board"""
+    bits = tile_bits(n)
+    mask = (1 << bits) - 1
+    if is_row:
+        cells = range(line*n, (line+1)*n)
+    else:
+        cells = range(line, n*n, n)
+    return [(board >> (bits * idx)) & mask for idx in cells]
+
+def heuristic_delta(state):
+    """change of manhattan_conflict from state.parent to state"""
+    # The tile moved from state.blank_index to parent.blank_index. Only its
+    # manhattan distance changes, and only the two lines it left and
+    # entered across the move can change their linear conflict. Those are
+    # rescanned in parent and child, O(n^2) per move for the longest run.
+    n = state.n
+    parent = state.parent
+    src = state.blank_index
+    dst = parent.blank_index
+    bits = tile_bits(n)
+    tile = (state.board >> (bits * dst)) & ((1 << bits) - 1)
+    delta = calculate_manhattan_dist(dst, tile, n) - calculate_manhattan_dist(src, tile, n)
+    if src % n == dst % n:
+        # vertical move, the tile changed rows
+        lines = (src // n, dst // n)
+        is_row = True
+    else:
+        lines = (src % n, dst % n)
+        is_row = False
+    for line in lines:
+        delta += line_conflict(board_line(state.board, n, line, is_row), n, line, is_row)
+        delta -= line_conflict(board_line(parent.board, n, line, is_row), n, line, is_row)
+    return delta
+
 def calculate_manhattan_dist(idx, value, n):
     """calculate the manhattan distance of a tile"""
     ### STUDENT CODE GOES HERE ###
     if value == 0:
         return 0
-    return abs(value%3 - idx%3) + abs(value/3 - idx/3)
+    return abs(value%n - idx%n) + abs(value//n - idx//n)
+
+GOAL_BOARDS = {}
+
+def goal_board(n):
+    """packed goal board [0, 1, ..., n*n-1], computed once per size"""
+    if n not in GOAL_BOARDS:
+        GOAL_BOARDS[n] = pack_config(list(range(n*n)), n)
+    return GOAL_BOARDS[n]
 
 def test_goal(puzzle_state):
     """test the state is the goal state or not"""
     ### STUDENT CODE GOES HERE ###
-    return puzzle_state.config == [0, 1, 2, 3, 4, 5, 6, 7, 8]
+    return puzzle_state.board == goal_board(puzzle_state.n)
+
+def is_solvable(config, n):
+    """inversion parity test: can config reach the goal at all"""
+    # A move keeps the inversion count's parity on odd boards. On even
+    # boards a vertical move flips it and changes the blank's row, so
+    # inversions + blank row keeps its parity. The goal has both at 0.
+    tiles = [value for value in config if value != 0]
+    inversions = 0
+    for i in range(len(tiles)):
+        for j in range(i + 1, len(tiles)):
+            if tiles[i] > tiles[j]:
+                inversions += 1
+    if n % 2 == 0:
+        inversions += config.index(0) // n
+    return inversions % 2 == 0
+
+DLS_LIMIT = 31                  # default dls limit, the 8-puzzle's longest optimal solution
+STATS_MODES = ("bfs", "dfs", "ast")     # the searches that take a SearchStats
+
+def run_search(search_mode, state, pdb=None, stats=None, limit=DLS_LIMIT, cache_size=0):
+    """run the search named by search_mode, None for an unknown mode"""
+    if   search_mode == "bfs": return bfs_search(state, stats)
+    elif search_mode == "dfs": return dfs_search(state, stats)
+    elif search_mode == "dls": return dls_search(state, limit, cache_size)
+    elif search_mode == "iddfs": return iddfs_search(state, cache_size)
+    elif search_mode == "ast": return A_star_search(state, pdb, stats)
+    elif search_mode == "ida": return ida_search(state, pdb)
+    elif search_mode == "bibfs": return bidirectional_search(state)
+    return None
+
+# Batch solving: boards are read one per line and solved in worker
+# processes, each keeping its pattern databases for the whole batch.
+
+BATCH_FIELDS = ["index", "board", "result", "cost_of_path", "nodes_expanded",
+                "max_search_depth", "running_time", "peak_memory_mb", "path_to_goal"]
+
+batch_options = {}
+batch_pdbs = {}
+
+def init_batch_worker(search_mode, heuristic, trace_memory, limit=DLS_LIMIT, cache_size=0):
+    """set up a worker process of solve_batch"""
+    global OUTPUT_FILE
+    OUTPUT_FILE = None
+    batch_options.update(search_mode=search_mode, heuristic=heuristic,
+                         trace_memory=trace_memory, limit=limit, cache_size=cache_size)
+
+def solve_instance(task):
+    """solve one (index, line) board in a batch worker, returns a result row"""
+    (index, line) = task
+    row = {"index": index, "board": line}
+    try:
+        config = list(map(int, line.split(",")))
+        n = int(math.sqrt(len(config)))
+        state = PuzzleState(config, n)
+    except Exception:
+        row["result"] = "Invalid"
+        return row
+
+    pdb = None
+    if batch_options["heuristic"] == "pdb":
+        if n not in batch_pdbs:
+            batch_pdbs[n] = PatternDatabase(n)
+        pdb = batch_pdbs[n]
+
+    if batch_options["trace_memory"]:
+        tracemalloc.start()
+    last_solution.clear()
+    start_time = time.time()
+    if is_solvable(config, n):
+        row["result"] = run_search(batch_options["search_mode"], state, pdb, None,
+                                   batch_options["limit"], batch_options["cache_size"])
+    else:
+        row["result"] = "Unsolvable"
+    row["running_time"] = round(time.time() - start_time, 8)
+
+    # peak traced allocations of this instance, or else the worker's
+    # maximum resident size so far
+    if batch_options["trace_memory"]:
+        row["peak_memory_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 3)
+        tracemalloc.stop()
+    else:
+        row["peak_memory_mb"] = round(resource.getrusage(resource.RUSAGE_SELF)[2] / 1024, 3)
+
+    row.update(last_solution)
+    if "path_to_goal" in row:
+        row["path_to_goal"] = " ".join(row["path_to_goal"])
+    return row
+
+def read_boards(source):
+    """(index, line) for every board line, skipping blanks and # comments"""
+    for (index, line) in enumerate(source):
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield (index, line)
+
+def solve_batch(search_mode, source, output, heuristic="manhattan", workers=None,
+                chunksize=16, trace_memory=False, limit=DLS_LIMIT, cache_size=0):
+    """solve the boards of source in parallel, streaming rows to output
+    (CSV if it ends in .csv, else JSON lines) as they finish"""
+    solved = 0
+    total = 0
+    with open(output, "w", newline="", buffering=1 << 16) as f, \
+         multiprocessing.Pool(workers, init_batch_worker,
+                              (search_mode, heuristic, trace_memory, limit, cache_size)) as pool:
+        if output.endswith(".csv"):
+            writer = csv.DictWriter(f, fieldnames=BATCH_FIELDS)
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            write = lambda row: f.write(json.dumps(row) + "\n")
+
+        for row in pool.imap_unordered(solve_instance, read_boards(source), chunksize):
+            write(row)
+            total += 1
+            solved += row["result"] == "Success"
+    return (solved, total)
+
+def count_arg(value):
+    """a count given as 100000 or 1e5"""
+    return int(float(value))
+
+def batch_main(args):
+    parser = argparse.ArgumentParser(prog="puzzle.py batch",
+                                     description="Solve one comma-separated board per line")
+    parser.add_argument("search_mode", choices=["bfs", "dfs", "dls", "iddfs", "ast", "ida", "bibfs"])
+    parser.add_argument("input", help="file of boards, - for stdin")
+    parser.add_argument("heuristic", nargs="?", default="manhattan", choices=["manhattan", "pdb"])
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--output", default="results.jsonl", help="result file, .csv or .jsonl")
+    parser.add_argument("--chunksize", type=int, default=16, help="boards sent to a worker at a time")
+    parser.add_argument("--limit", type=count_arg, default=DLS_LIMIT, help="depth limit of dls")
+    parser.add_argument("--cache", type=count_arg, default=0, help="dls/iddfs transposition cache entries")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="measure each board's peak allocations with tracemalloc (slower)")
+    args = parser.parse_args(args)
+
+    start_time = time.time()
+    source = sys.stdin if args.input == "-" else open(args.input)
+    with source:
+        (solved, total) = solve_batch(args.search_mode, source, args.output, args.heuristic,
+                                      args.workers, args.chunksize, args.trace_memory,
+                                      args.limit, args.cache)
+    print("solved %d of %d boards in %.2fs" % (solved, total, time.time() - start_time))
+
+def pop_option(args, name, default=None):
+    """remove `name value` from args and return value, or default"""
+    if name not in args:
+        return default
+    i = args.index(name)
+    value = args[i + 1]
+    del args[i : i+2]
+    return value
 
 # Main Function that reads in Input and Runs corresponding Algorithm
 def main():
+    if sys.argv[1].lower() == "batch":
+        return batch_main(sys.argv[2:])
+    # --stats trace.json [--stats-every K] writes a SearchStats trace
+    stats_file  = pop_option(sys.argv, "--stats")
+    stats_every = count_arg(pop_option(sys.argv, "--stats-every", 1000))
+    stats       = SearchStats(stats_every) if stats_file else None
+    # --limit N sets the dls depth limit, --cache N bounds the dls/iddfs
+    # transposition cache (off by default)
+    limit       = count_arg(pop_option(sys.argv, "--limit", DLS_LIMIT))
+    cache_size  = count_arg(pop_option(sys.argv, "--cache", 0))
+    # --check compares every incremental A* h, manhattan or pdb, with a
+    # full recomputation
+    check       = "--check" in sys.argv
+    if check:
+        sys.argv.remove("--check")
     search_mode = sys.argv[1].lower()
+    if stats is not None and search_mode not in STATS_MODES:
+        print("--stats only traces " + ", ".join(STATS_MODES))
+        return
+    if check and search_mode != "ast":
+        print("--check only checks ast")
+        return
     begin_state = sys.argv[2].split(",")
     begin_state = list(map(int, begin_state))
     board_size  = int(math.sqrt(len(begin_state)))
     hard_state  = PuzzleState(begin_state, board_size)
+    heuristic   = sys.argv[3].lower() if len(sys.argv) > 3 else "manhattan"
+    pdb         = PatternDatabase(board_size) if heuristic == "pdb" else None
+    if check:
+        global CHECK_INCREMENTAL
+        CHECK_INCREMENTAL = True
     factor = 1024E3             # factor for calculating ram usage
     start_time  = time.time()
     
-    if   search_mode == "bfs": bfs_search(hard_state)
-    elif search_mode == "dfs": dfs_search(hard_state)
-    elif search_mode == "ast": A_star_search(hard_state)
-    else: 
+    result = None
+    goal_board(board_size)
+    
+    # unsolvable boards would make every search exhaust its half of the
+    # state space, so they are rejected before searching
+    if not is_solvable(begin_state, board_size): result = "Unsolvable"
+    else: result = run_search(search_mode, hard_state, pdb, stats, limit, cache_size)
+    if result is None:
         print("Enter valid command arguments !")
+    if stats is not None and stats.samples:
+        stats.to_json(stats_file)
         
+    if result is not None and result != "Success":
+        writeOutput("result: " + result + "\n")
     end_time = time.time()
     time_used = round(end_time-start_time, 8)
     ram_used = round(resource.getrusage(resource.RUSAGE_SELF)[2]/factor, 8)
@@ -5,6 +5,8 @@ import queue as Q
 import time
 from statistics import mean, stdev
 import sys
+import argparse
+import multiprocessing
 
 """
 Each sudoku board is represented as a dictionary with string keys and
@@ -46,6 +48,14 @@ def print_board(board):
         print(row)
 
 
+def board_from_string(line):
+    """Helper function to parse an 81-digit line, 0 or . for a blank."""
+    line = line.replace('.', '0')
+    if len(line) != 81 or not line.isdigit():
+        raise ValueError("not a sudoku board: %r" % line)
+    return { ROW[r] + COL[c]: int(line[9*r+c])
+        for r in range(9) for c in range(9)}
+
 def board_to_string(board):
     """Helper function to convert board dictionary to string for writing."""
     ordered_vals = []
@@ -54,88 +64,489 @@ def board_to_string(board):
             ordered_vals.append(str(board[r + c]))
     return ''.join(ordered_vals)
 
+# The solver works on a list of 81 cells indexed 9*row + col, in the
+# order of board_to_string, holding 0 for an empty cell. Each cell also
+# has a domain, a 9-bit mask with bit v-1 set when digit v is still
+# possible; an assigned cell's domain is the bit of its digit.
+
+ALL_DIGITS = (1 << 9) - 1
+CELL_NAMES = [r + c for r in ROW for c in COL]
+ROW_OF = [i // 9 for i in range(81)]
+COL_OF = [i % 9 for i in range(81)]
+BOX_OF = [3 * (i // 27) + (i % 9) // 3 for i in range(81)]
+UNITS = ([tuple(i for i in range(81) if ROW_OF[i] == u) for u in range(9)] +
+         [tuple(i for i in range(81) if COL_OF[i] == u) for u in range(9)] +
+         [tuple(i for i in range(81) if BOX_OF[i] == u) for u in range(9)])
+PEERS = [tuple(j for j in range(81) if j != i and (ROW_OF[j] == ROW_OF[i] or
+               COL_OF[j] == COL_OF[i] or BOX_OF[j] == BOX_OF[i])) for i in range(81)]
+POPCOUNT = [bin(mask).count("1") for mask in range(1 << 9)]
+DIGIT = {1 << (v - 1): v for v in range(1, 10)}
+
+# Propagation levels, each doing the work of the ones before it:
+#   fc      forward checking, an assignment removes its digit from the
+#           domains of its peers
+#   ac3     arc consistency, a cell left with one candidate is assigned
+#           in turn. For the != constraints of sudoku this is exactly
+#           naked-single propagation
+#   hidden  also assigns a digit that has one possible cell in a unit
+PROPAGATION = ("fc", "ac3", "hidden")
+
+def board_to_cells(board):
+    """Convert a board dictionary to the solver's list of 81 cells."""
+    return [board[name] for name in CELL_NAMES]
+
+def cells_to_board(cells):
+    """Convert a list of 81 cells back to a board dictionary."""
+    return dict(zip(CELL_NAMES, cells))
+
+class SudokuCSP(object):
+    """
+        Cells and domains of a board being solved. Every change to a
+        cell or domain first pushes (cell, old domain, old value) onto
+        trail, so undo(mark) restores the state at len(trail) == mark
+        without copying anything.
+
+        stats counts the search nodes (values tried), the cells assigned
+        by propagation and the wipeouts found by forward checking.
+    """
+    def __init__(self, cells, propagation="hidden"):
+        self.cells = [0] * 81
+        self.domains = [ALL_DIGITS] * 81
+        self.trail = []
+        self.queue = []
+        self.level = PROPAGATION.index(propagation)
+        self.stats = {"nodes": 0, "propagated": 0, "wipeouts": 0}
+        self.consistent = all(self.assign(i, 1 << (v - 1))
+                              for i, v in enumerate(cells) if v != 0) and self.propagate()
+
+    def assign(self, i, bit):
+        """Set cell i to the digit of bit and remove it from the peers'
+        domains, False on a wipeout."""
+        cells, domains, trail = self.cells, self.domains, self.trail
+        if not domains[i] & bit:
+            return False
+        trail.append((i, domains[i], cells[i]))
+        domains[i] = bit
+        cells[i] = DIGIT[bit]
+        for p in PEERS[i]:
+            d = domains[p]
+            if d & bit:
+                trail.append((p, d, cells[p]))
+                d ^= bit
+                domains[p] = d
+                if d == 0:
+                    self.stats["wipeouts"] += 1
+                    return False
+                if self.level and POPCOUNT[d] == 1:
+                    self.queue.append(p)
+        return True
+
+    def propagate(self):
+        """Assign the cells forced by the propagation level, False on a
+        contradiction."""
+        if self.level == 0:
+            return True
+        queue = self.queue
+        while True:
+            while queue:
+                i = queue.pop()
+                if self.cells[i] == 0:
+                    self.stats["propagated"] += 1
+                    if not self.assign(i, self.domains[i]):
+                        return False
+            if self.level < 2:
+                return True
+            # None means cells were assigned, so go round again
+            result = self.hidden_singles()
+            if result is not None:
+                return result
+
+    def hidden_singles(self):
+        """Assign every digit with one possible cell in a unit. Returns
+        True when nothing was assigned, None after assignments and False
+        on a contradiction."""
+        cells, domains = self.cells, self.domains
+        changed = False
+        for unit in UNITS:
+            once = twice = 0
+            for i in unit:
+                d = domains[i]
+                twice |= once & d
+                once |= d
+            if once != ALL_DIGITS:
+                return False
+            only = once & ~twice
+            if not only:
+                continue
+            for i in unit:
+                bit = domains[i] & only
+                if bit and cells[i] == 0:
+                    if POPCOUNT[bit] > 1:
+                        return False
+                    self.stats["propagated"] += 1
+                    if not self.assign(i, bit):
+                        return False
+                    changed = True
+        return None if changed else True
+
+    def undo(self, mark):
+        """Restore the cells and domains to trail length mark, dropping
+        the cells queued by a failed propagation."""
+        cells, domains, trail = self.cells, self.domains, self.trail
+        del self.queue[:]
+        while len(trail) > mark:
+            (i, domains[i], cells[i]) = trail.pop()
+
 def mrv(csp):
-    # minimum remaining variable heuristic
-    # return a variable e.g. A1
-    return min(csp, key=csp.get)
-
-def lcv(var, assignment, csp):
-    # least constraining value
-    # return list of value in lcv order
-    neighbors = NEIGHBORS[var]
-    unassigned_neighbors = neighbors.difference(set(assignment.keys()))
-    assigned_neighbors = neighbors.intersection(set(assignment.keys()))
-    constraints = [assignment[n] for n in assigned_neighbors]
-     ## initialize list of domain value for a variable
-    domain = {}
-    for value in csp[var]:
-        if value not in constraints:
-            domain[value] = 0
-    ## find the least contraining value by exmaining neighbor domains    
-    for n in unassigned_neighbors:
-        for d in csp[n]:
-            if d in domain:
-                domain[d] += 1       # increment value count
-    ## sort the lcv dict in ascending order
-    domain_in_lcv = [item[0] for item in sorted(domain.items(), key=lambda x:x[1])]
-    return domain_in_lcv, unassigned_neighbors
-
-def backtrack(assignment, csp):
-    # check if assignment is complete
-    if len(assignment) == 81:
-        return assignment
-    if len(csp) == 0:
-        return "failure"
-    var = mrv(csp)
-    recover = {}    # for csp backtracking
-    lcv_domain, unassigned_neighbors = lcv(var, assignment, csp)
-    for value in lcv_domain:
-        assignment[var] = value
-        recover[var] = csp[var]
-        del csp[var]
-        result = backtrack(assignment, csp)
-        if result != "failure":
-            return result
-        del assignment[var]
-        csp[var] = recover[var]
-    return "failure"
-
-def backtracking(board):
+    # minimum remaining values heuristic
+    # return the empty cell with the smallest domain, None once every
+    # cell is filled
+    cells, domains = csp.cells, csp.domains
+    best, best_count = None, 10
+    for i in range(81):
+        if cells[i] == 0:
+            count = POPCOUNT[domains[i]]
+            if count < best_count:
+                best, best_count = i, count
+                if count <= 1:
+                    break
+    return best
+
+def backtrack(csp):
+    # fill the empty cells of csp in place, return True when solved
+    i = mrv(csp)
+    if i is None:
+        return True
+    mask = csp.domains[i]
+    while mask:
+        bit = mask & -mask
+        mask ^= bit
+        mark = len(csp.trail)
+        csp.stats["nodes"] += 1
+        if csp.assign(i, bit) and csp.propagate() and backtrack(csp):
+            return True
+        csp.undo(mark)
+    return False
+
+def backtracking(board, propagation="hidden", stats=None):
     """Takes a board and returns solved board."""
-    # setup a assignment and domain dictionary
-    assignment = {}
-    csp = {}
-    for var in board:
-        if board[var] != 0:
-            assignment[var] = board[var]
+    # propagation is one of PROPAGATION; the solver's counters are
+    # copied into the stats dictionary when one is given, with the nodes
+    # of a forward-checking-only solve of the same board as fc_nodes and
+    # saved = fc_nodes - nodes, the nodes the propagation level saved
+    cells = board_to_cells(board)
+    csp = SudokuCSP(cells, propagation)
+    solved = csp.consistent and backtrack(csp)
+    if stats is not None:
+        stats.update(csp.stats)
+        if propagation == "fc":
+            stats["fc_nodes"] = csp.stats["nodes"]
         else:
-            csp[var] = {1, 2, 3, 4, 5, 6, 7, 8, 9}
-            #for n in neighbors_of(var):
-            #    csp[var].discard(board[n])
-    # restrict domains by propagating assignment
-    ## commenting out the following solves hardest sudoku in 40 secs
+            fc = SudokuCSP(cells, "fc")
+            if fc.consistent:
+                backtrack(fc)
+            stats["fc_nodes"] = fc.stats["nodes"]
+        stats["saved"] = stats["fc_nodes"] - stats["nodes"]
+    if not solved:
+        return "failure"
+    return cells_to_board(csp.cells)
 
-    for var in assignment.keys():
-        for n in NEIGHBORS[var]:
-            if n in csp:
-                csp[n].discard(assignment[var])
-    solved_board = backtrack(assignment, csp)
-    return solved_board
 
+# Dancing links backend. A board of size N = n*n is an exact cover
+# problem with a row for every (cell, digit) and 4*N*N columns: each
+# cell, and each digit in each row, column and box, is covered once.
+# Works for any n, e.g. 16x16 and 25x25 boards written with SYMBOLS.
 
-if __name__ == '__main__':
-    
+SYMBOLS = "0123456789ABCDEFGHIJKLMNOP"
+
+def cells_from_string(line):
+    """Parse a board line of any size N*N, N = n*n, to a list of cells."""
+    line = line.replace('.', '0').upper()
+    size = int(round(len(line) ** 0.5))
+    box = int(round(size ** 0.5))
+    if box * box != size or size * size != len(line) or size >= len(SYMBOLS):
+        raise ValueError("not a sudoku board: %r" % line)
+    cells = [SYMBOLS.find(ch) for ch in line]
+    if min(cells) < 0 or max(cells) > size:
+        raise ValueError("not a sudoku board: %r" % line)
+    return cells
+
+def cells_to_string(cells):
+    """Write a list of cells as a board line, as board_to_string does."""
+    return ''.join(SYMBOLS[value] for value in cells)
+
+class DancingLinks(object):
     """
-    #  Read boards from source.
-    src_filename = 'sudokus_start.txt'
-    #src_filename = 'hardest_sudoku.txt'
-    try:
-        srcfile = open(src_filename, "r")
-        sudoku_list = srcfile.read()
-    except:
-        print("Error reading the sudoku file %s" % src_filename)
-        exit()
+        Algorithm X on a toroidal doubly linked matrix kept in flat lists:
+        node k has neighbours left[k], right[k], up[k], down[k] and column
+        column[k]. Node 0 is the root and nodes 1..4*N*N are the column
+        headers, with size[c] the number of rows left in column c. The
+        givens are applied while building: their columns are left out of
+        the header list and rows clashing with them are not created.
     """
+    def __init__(self, cells):
+        self.cells = list(cells)
+        size = int(round(len(cells) ** 0.5))
+        box = int(round(size ** 0.5))
+        area = size * size
+        columns = 4 * area
+        self.left = [c - 1 for c in range(columns + 1)]
+        self.right = [c + 1 for c in range(columns + 1)]
+        self.up = list(range(columns + 1))
+        self.down = list(range(columns + 1))
+        self.column = list(range(columns + 1))
+        self.size = [0] * (columns + 1)
+        self.candidate = [None] * (columns + 1)    # (cell, digit) of a row node
+        self.consistent = True
+
+        def constraints(i, digit):
+            r, c = divmod(i, size)
+            b = (r // box) * box + c // box
+            return (1 + i, 1 + area + r * size + digit - 1,
+                    1 + 2 * area + c * size + digit - 1,
+                    1 + 3 * area + b * size + digit - 1)
+
+        # drop the columns covered by the givens from the header list
+        covered = [False] * (columns + 1)
+        for i, value in enumerate(cells):
+            if value != 0:
+                for c in constraints(i, value):
+                    if covered[c]:
+                        self.consistent = False
+                    covered[c] = True
+        active = [0] + [c for c in range(1, columns + 1) if not covered[c]]
+        for k, c in enumerate(active):
+            self.right[c] = active[(k + 1) % len(active)]
+            self.left[c] = active[k - 1]
+
+        for i, value in enumerate(cells):
+            if value != 0:
+                continue
+            for digit in range(1, size + 1):
+                row = constraints(i, digit)
+                if any(covered[c] for c in row):
+                    continue
+                first = len(self.column)
+                for k, c in enumerate(row):
+                    node = first + k
+                    self.left.append(first + (k - 1) % 4)
+                    self.right.append(first + (k + 1) % 4)
+                    self.up.append(self.up[c])
+                    self.down.append(c)
+                    self.down[self.up[c]] = node
+                    self.up[c] = node
+                    self.column.append(c)
+                    self.candidate.append((i, digit))
+                    self.size[c] += 1
+
+    def cover(self, c):
+        left, right, up, down, column, size = (self.left, self.right, self.up,
+                                               self.down, self.column, self.size)
+        right[left[c]] = right[c]
+        left[right[c]] = left[c]
+        i = down[c]
+        while i != c:
+            j = right[i]
+            while j != i:
+                down[up[j]] = down[j]
+                up[down[j]] = up[j]
+                size[column[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+    def uncover(self, c):
+        left, right, up, down, column, size = (self.left, self.right, self.up,
+                                               self.down, self.column, self.size)
+        i = up[c]
+        while i != c:
+            j = left[i]
+            while j != i:
+                size[column[j]] += 1
+                down[up[j]] = j
+                up[down[j]] = j
+                j = left[j]
+            i = up[i]
+        right[left[c]] = c
+        left[right[c]] = c
+
+    def choose(self):
+        # the column with fewest rows left, as MRV does for cells
+        right, size = self.right, self.size
+        best, c = right[0], right[right[0]]
+        while c != 0 and size[best] > 1:
+            if size[c] < size[best]:
+                best = c
+            c = right[c]
+        return best
+
+    def restore(self, chosen):
+        # uncover the rows in chosen and their columns, deepest first,
+        # leaving the matrix as it was before solutions() was called
+        left, column = self.left, self.column
+        for r in reversed(chosen):
+            j = left[r]
+            while j != r:
+                self.uncover(column[j])
+                j = left[j]
+            self.uncover(column[r])
+
+    def solutions(self, limit=1):
+        """Return up to limit solved lists of cells. The matrix is left as
+        it was, so an instance can be searched again."""
+        found = []
+        if not self.consistent:
+            return found
+        if self.right[0] == 0:
+            return [list(self.cells)]
+        right, left, down, column = self.right, self.left, self.down, self.column
+        chosen = []
+        c = self.choose()
+        self.cover(c)
+        r = down[c]
+        # iterative Algorithm X, chosen holding the row node selected at
+        # each level; r == c means column c has no rows left to try
+        while True:
+            if r != c:
+                chosen.append(r)
+                j = right[r]
+                while j != r:
+                    self.cover(column[j])
+                    j = right[j]
+                if right[0] == 0:
+                    solved = list(self.cells)
+                    for node in chosen:
+                        (i, digit) = self.candidate[node]
+                        solved[i] = digit
+                    found.append(solved)
+                    if len(found) >= limit:
+                        self.restore(chosen)
+                        return found
+                else:
+                    next_c = self.choose()
+                    if self.size[next_c] > 0:
+                        c = next_c
+                        self.cover(c)
+                        r = down[c]
+                        continue
+                chosen.pop()
+            else:
+                self.uncover(c)
+                if not chosen:
+                    return found
+                r = chosen.pop()
+                c = column[r]
+            j = left[r]
+            while j != r:
+                self.uncover(column[j])
+                j = left[j]
+            r = down[r]
+
+def count_solutions(cells, limit=2):
+    """Number of solutions of a list of cells, counting no further than
+    limit. A board is uniquely solvable when count_solutions(cells) == 1."""
+    return len(DancingLinks(cells).solutions(limit))
+
+def dancing_links(board):
+    """Takes a board and returns solved board, as backtracking() does."""
+    found = DancingLinks(board_to_cells(board)).solutions(1)
+    if not found:
+        return "failure"
+    return cells_to_board(found[0])
+
+
+# Batch solving: boards are read one per line from a file or stdin and
+# solved in worker processes, a chunk of lines at a time.
+
+worker_propagation = "hidden"
+worker_backend = "backtracking"
+
+def init_worker(propagation, backend="backtracking"):
+    """Set the propagation level and backend of a solve_line worker."""
+    global worker_propagation, worker_backend
+    worker_propagation = propagation
+    worker_backend = backend
+
+def solve_line(line):
+    """Solve one board line, returns (solution string, seconds). The
+    solution is "failure" for an unsolvable board and "invalid" for a
+    line that is not a board. The dlx backend takes boards of any size."""
+    start_time = time.time()
+    if worker_backend == "dlx":
+        try:
+            cells = cells_from_string(line)
+        except ValueError:
+            return "invalid", 0.0
+        found = DancingLinks(cells).solutions(1)
+        seconds = time.time() - start_time
+        if not found:
+            return "failure", seconds
+        return cells_to_string(found[0]), seconds
+    try:
+        board = board_from_string(line)
+    except ValueError:
+        return "invalid", 0.0
+    solved_board = backtracking(board, worker_propagation)
+    seconds = time.time() - start_time
+    if solved_board == "failure":
+        return solved_board, seconds
+    return board_to_string(solved_board), seconds
+
+def read_lines(source):
+    """Yield the non-blank lines of source, stripped."""
+    for line in source:
+        line = line.strip()
+        if line:
+            yield line
+
+def solve_batch(source, out_filename, workers=None, chunksize=64, propagation="hidden",
+                backend="backtracking"):
+    """Solve every board of source, writing one solution per line to
+    out_filename in input order. Returns the solve times of the valid
+    boards."""
+    running_time = []
+    with open(out_filename, "w", buffering=1 << 16) as outfile, \
+         multiprocessing.Pool(workers, init_worker, (propagation, backend)) as pool:
+        for solution, seconds in pool.imap(solve_line, read_lines(source), chunksize):
+            outfile.write(solution)
+            outfile.write('\n')
+            if solution != "invalid":
+                running_time.append(seconds)
+    return running_time
+
+def print_running_time(running_time):
+    """Print min, mean, stdev and max of the solve times."""
+    if not running_time:
+        print("No boards solved")
+        return
+    spread = stdev(running_time) if len(running_time) > 1 else 0.0
+    print("boards: %d" % len(running_time))
+    print("min: %.6f  mean: %.6f  stdev: %.6f  max: %.6f" % (
+        min(running_time), mean(running_time), spread, max(running_time)))
+
+def batch_main(args):
+    parser = argparse.ArgumentParser(prog="sudoku.py batch",
+                                     description="Solve one 81-digit board per line")
+    parser.add_argument("input", help="file of boards, - for stdin")
+    parser.add_argument("--output", default="output.txt", help="solution file")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--chunksize", type=int, default=64, help="boards sent to a worker at a time")
+    parser.add_argument("--propagation", default="hidden", choices=PROPAGATION)
+    parser.add_argument("--backend", default="backtracking", choices=["backtracking", "dlx"])
+    args = parser.parse_args(args)
+
+    source = sys.stdin if args.input == "-" else open(args.input)
+    with source:
+        running_time = solve_batch(source, args.output, args.workers,
+                                   args.chunksize, args.propagation, args.backend)
+    print_running_time(running_time)
+
+
+if __name__ == '__main__':
+    
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        batch_main(sys.argv[2:])
+        sys.exit()
+
     # Setup output file
     out_filename = 'output.txt'
     outfile = open(out_filename, "w")
@@ -146,15 +557,22 @@ if __name__ == '__main__':
     line = sys.argv[1]
 
     # Parse boards to dict representation, scanning board L to R, Up to Down
-    board = { ROW[r] + COL[c]: int(line[9*r+c])
-        for r in range(9) for c in range(9)}
+    board = board_from_string(line)
 
     # Print starting board. TODO: Comment this out when timing runs.
     print_board(board)
 
-    # Solve with backtracking
+    # Solve with backtracking, propagating as set by the optional
+    # second argument (fc, ac3 or hidden), or with dancing links (dlx)
+    propagation = sys.argv[2] if len(sys.argv) > 2 else "hidden"
+    stats = {}
     #start_time  = time.time()
-    solved_board = backtracking(board)
+    if propagation == "dlx":
+        solved_board = dancing_links(board)
+    else:
+        solved_board = backtracking(board, propagation, stats)
+        print("nodes: %(nodes)d  propagated: %(propagated)d  wipeouts: %(wipeouts)d  "
+              "fc nodes: %(fc_nodes)d  nodes saved: %(saved)d" % stats)
     #end_time = time.time()
 
     # Print solved board. TODO: Comment this out when timing runs.